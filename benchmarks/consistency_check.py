@@ -0,0 +1,338 @@
+"""Correctness checks for the caches and incremental rollups in main.py.
+
+Drives the ASGI app directly against the fake Turso server and exits with
+status 1 when any check fails:
+
+- cleanup: a conditional GET of /health-metrics/ after
+  /data-cleanup/invalid-records returns 200 with the new rows, not 304
+- status-poll: a 200 from /health-status after a write takes one round trip,
+  and a 304 right after it none
+- fleet-batch: a 500-reading batch spanning 8 hours takes at most three round
+  trips (device lookup, insert, fleet sketches with activity), and a batch five
+  hours older still shows up in /fleet/stats
+- fleet-durable: single posts and a batch are in fleet_sketches as soon as
+  their requests return, and rows past the retention window are deleted
+- batch-atomic: a 500-reading batch whose last insert chunk fails stores
+  none of its readings and reports the failure
+- batch-rate: with rate limits on, a band's full batch is admitted, and a
+  second one right after it gets 429 until a whole batch of tokens refills
+- activity-day: readings taken now at +14:00 and -12:00 both count towards
+  the default "today" of the dashboard and the device report
+- retries: with 20% of pipelines answering 503, retried reads succeed
+- breaker: during an outage an open circuit breaker bounds the attempts that
+  reach the server
+- deadline: with every pipeline stalled for 3 s, a 0.5 s request deadline
+  bounds each read
+- write-retries: failed writes and transactions are sent exactly once
+- report-lease: a lease held by another instance is taken over once the
+  snapshots are past their max age, and not before; a hot report built live
+  because its snapshot was stale is stored as the new snapshot
+- activity-order: a day with a step counter reset has the same total whether
+  a reading inside the day arrives live or after the later ones
+
+    python benchmarks/consistency_check.py
+    python benchmarks/consistency_check.py --check cleanup
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import fake_turso  # noqa: E402
+from resilience_bench import DEFAULTS as RESILIENCE_DEFAULTS, run_variant  # noqa: E402
+
+
+def call(app, method, path, body=None, headers=None):
+    # Returns (status, headers, parsed JSON body or None)
+    messages = []
+    path, _, query = path.partition("?")
+    payload = json.dumps(body).encode() if body is not None else b""
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    request_headers = [(b"host", b"localhost"), (b"content-type", b"application/json")]
+    request_headers += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": request_headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 80),
+    }
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    response_headers = {name.decode().lower(): value.decode() for name, value in start.get("headers", [])}
+    raw = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], response_headers, json.loads(raw) if raw else None
+
+
+def reading(device_id, when, **fields):
+    return {"device_id": device_id, "timestamp": when.isoformat(), **fields}
+
+
+def check_cleanup(main, db):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    # An out-of-range row among the newest 50 but not the newest, so MAX(id) survives the cleanup
+    with db.lock:
+        db.conn.execute("INSERT INTO health_metrics (device_id, user_id, heart_rate, timestamp) VALUES ('CHECK001', 1, 400, ?)", [now.isoformat()])
+    for minutes, heart_rate in ((5, 70), (4, 71), (3, 72)):
+        call(main.app, "POST", "/health-metrics/", reading("CHECK001", now - timedelta(minutes=minutes), heart_rate=heart_rate))
+    status, headers, body = call(main.app, "GET", "/health-metrics/")
+    before = body["count"]
+    call(main.app, "POST", "/data-cleanup/invalid-records")
+    status, _, body = call(main.app, "GET", "/health-metrics/", headers={"If-None-Match": headers["etag"]})
+    assert status == 200, f"conditional GET after cleanup answered {status}"
+    assert body["count"] == before - 1, f"listing has {body['count']} rows, expected {before - 1}"
+    return f"{before} -> {body['count']} rows, 200 after cleanup"
+
+
+def check_status_poll(main, db):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    call(main.app, "POST", "/health-metrics/", reading("STATUS001", now, heart_rate=72, spo2=98, temperature=36.6, steps=10, calories=1))
+    db.reset_stats()
+    status, headers, body = call(main.app, "GET", "/health-status/STATUS001")
+    trips = db.stats()["round_trips"]
+    assert status == 200 and body["current_metrics"]["heart_rate"] == 72, f"status answered {status} {body}"
+    assert trips == 1, f"200 took {trips} round trips"
+    db.reset_stats()
+    status, _, _ = call(main.app, "GET", "/health-status/STATUS001", headers={"If-None-Match": headers["etag"]})
+    assert status == 304, f"repeat poll answered {status}"
+    assert db.stats()["round_trips"] == 0, f"304 took {db.stats()['round_trips']} round trips"
+    return f"200 in {trips} round trip, 304 in 0"
+
+
+def spaced_batch(device_id, end, hours, count):
+    step = timedelta(hours=hours) / count
+    return [reading(device_id, end - step * i, heart_rate=60 + i % 40, spo2=97) for i in range(count)]
+
+
+def check_fleet_batch(main, db):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    db.reset_stats()
+    status, _, body = call(main.app, "POST", "/health-metrics/batch", {"readings": spaced_batch("FLEET001", now, 8, 500)})
+    trips = db.stats()["round_trips"]
+    assert body.get("accepted") == 500, f"batch answered {body}"
+    assert trips <= 3, f"batch took {trips} round trips"
+
+    late_trips_before = db.stats()["round_trips"]
+    call(main.app, "POST", "/health-metrics/batch", {"readings": spaced_batch("FLEET001", now - timedelta(hours=5), 8, 500)})
+    late_trips = db.stats()["round_trips"] - late_trips_before
+    status, _, stats = call(main.app, "GET", "/fleet/stats?minutes=1440")
+    assert stats["readings"] >= 1000, f"/fleet/stats counts {stats['readings']} of 1000 readings"
+    return f"{trips} and {late_trips} round trips, {stats['readings']} readings in /fleet/stats"
+
+
+def check_fleet_durable(main, db):
+    # Two days back, so no other check has this bucket in memory
+    start = main.fleet_bucket_start(main.utc_now() - timedelta(days=2)).replace(tzinfo=timezone.utc)
+    with db.lock:
+        db.conn.execute("INSERT INTO fleet_sketches (bucket_start, instance_id, readings, sketch) VALUES ('2000-01-01T00:00:00', 'old', 1, '{}')")
+    for seconds in (1, 2, 3):
+        call(main.app, "POST", "/health-metrics/", reading("DURABLE001", start + timedelta(seconds=seconds), heart_rate=70))
+    call(main.app, "POST", "/health-metrics/batch", {"readings": [reading("DURABLE002", start + timedelta(seconds=10 + i), heart_rate=80) for i in range(10)]})
+    with db.lock:
+        stored = db.conn.execute("SELECT COALESCE(SUM(readings), 0) FROM fleet_sketches WHERE bucket_start = ?", [start.replace(tzinfo=None).isoformat()]).fetchone()[0]
+        old = db.conn.execute("SELECT COUNT(*) FROM fleet_sketches WHERE bucket_start < '2001-01-01'").fetchone()[0]
+    assert stored == 13, f"fleet_sketches holds {stored} of 13 readings before any /fleet/stats call"
+    assert old == 0, "a fleet_sketches row past the retention window survived"
+    return f"{stored} readings stored on ingest, expired rows deleted"
+
+
+def check_batch_atomic(main, db):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    readings = spaced_batch("ATOMIC001", now, 1, main.MAX_BATCH_READINGS - 1) + [reading("ATOMIC002", now, heart_rate=70)]
+    with db.lock:
+        db.conn.execute("CREATE TEMP TRIGGER fail_atomic BEFORE INSERT ON health_metrics WHEN NEW.device_id = 'ATOMIC002' BEGIN SELECT RAISE(ABORT, 'injected failure'); END")
+    try:
+        status, _, body = call(main.app, "POST", "/health-metrics/batch", {"readings": readings})
+    finally:
+        with db.lock:
+            db.conn.execute("DROP TRIGGER fail_atomic")
+    with db.lock:
+        stored = db.conn.execute("SELECT COUNT(*) FROM health_metrics WHERE device_id = 'ATOMIC001'").fetchone()[0]
+    assert body.get("success") is False, f"failed batch answered {body}"
+    assert stored == 0, f"{stored} readings of the failed batch were committed"
+    return "failed batch left 0 rows"
+
+
+def check_batch_rate(main, db):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    main.RATE_LIMIT_ENABLED = True
+    try:
+        status, _, body = call(main.app, "POST", "/health-metrics/batch", {"readings": spaced_batch("RATE001", now, 1, main.MAX_BATCH_READINGS)})
+        assert body.get("accepted") == main.MAX_BATCH_READINGS, f"first batch answered {status} {body}"
+        status, headers, body = call(main.app, "POST", "/health-metrics/batch", {"readings": spaced_batch("RATE001", now - timedelta(hours=1), 1, main.MAX_BATCH_READINGS)})
+        assert status == 429, f"second batch answered {status} {body}"
+        # Every reading is charged, so the band waits for a whole batch worth of tokens
+        needed = main.MAX_BATCH_READINGS / main.device_batch_rate_limits.rate
+        assert int(headers["retry-after"]) >= needed, f"Retry-After {headers['retry-after']} s, expected at least {needed:g} s"
+    finally:
+        main.RATE_LIMIT_ENABLED = False
+    return f"second batch rejected, retry after {headers['retry-after']} s"
+
+
+def check_activity_day(main, db):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    # Together these offsets always put at least one local date apart from the UTC date
+    call(main.app, "POST", "/health-metrics/", reading("DAY001", (now - timedelta(minutes=1)).astimezone(timezone(timedelta(hours=14))), steps=100))
+    call(main.app, "POST", "/health-metrics/", reading("DAY001", now.astimezone(timezone(timedelta(hours=-12))), steps=150))
+    today = main.get_activity_today("DAY001")
+    assert today["readings"] == 2, f"today ({today['day']}) has {today['readings']} of 2 readings"
+    return f"{today['day']}: {today['readings']} readings from both offsets"
+
+
+def check_activity_order(main, db):
+    start = datetime(2025, 3, 1, 9, 0, tzinfo=timezone.utc)
+    steps = [(start, 100), (start + timedelta(hours=1), 150), (start + timedelta(hours=2), 20)]
+    for device_id, order in (("ORDER001", (0, 1, 2)), ("ORDER002", (0, 2, 1))):
+        for index in order:
+            when, value = steps[index]
+            call(main.app, "POST", "/health-metrics/", reading(device_id, when, steps=value))
+    totals = [main.get_activity_today(device_id, "2025-03-01")["steps"] for device_id in ("ORDER001", "ORDER002")]
+    assert totals[0] == totals[1] == 170, f"in order {totals[0]} steps, late middle reading {totals[1]} steps, expected 170"
+    return f"{totals[0]} steps either way"
+
+
+def check_report_lease(main, db):
+    now = time.time()
+    stale = now - 2 * main.REPORT_SNAPSHOT_MAX_AGE_SECONDS
+    with db.lock:
+        db.conn.execute("INSERT OR REPLACE INTO scheduler_leases (name, holder, expires_at) VALUES (?, 'frozen', ?)", [main.REPORT_LEASE, now + 3600])
+        for key in main.REPORT_SNAPSHOTS:
+            db.conn.execute("INSERT OR REPLACE INTO report_snapshots (report_key, body, generated_at, generated_by) VALUES (?, ?, ?, 'frozen')", [key, json.dumps({"success": True}), now])
+    assert not main.acquire_lease(main.REPORT_LEASE, 60, main.report_snapshots_stale()), "took a live lease while its snapshots were fresh"
+    with db.lock:
+        db.conn.execute("UPDATE report_snapshots SET generated_at = ?", [stale])
+    assert main.acquire_lease(main.REPORT_LEASE, 60, main.report_snapshots_stale()), "a lease with stale snapshots was not taken over"
+
+    main.report_snapshots.clear()
+    main.report_scheduler = "started"  # keep the background thread out of the check
+    status, _, body = call(main.app, "GET", "/fleet/stats?minutes=60")
+    with db.lock:
+        generated_at = db.conn.execute("SELECT generated_at FROM report_snapshots WHERE report_key = 'fleet-stats:60'").fetchone()[0]
+    assert body.get("success") and "snapshot" not in body, f"stale snapshot served: {body}"
+    assert generated_at > stale, "the live build did not replace the stale snapshot"
+    return "stale lease taken over, live build stored"
+
+
+def with_resilience_defaults(check):
+    # Resilience checks change the client's settings and breaker; put them back after
+    def run(main, db):
+        saved = {name: getattr(main, name) for name in RESILIENCE_DEFAULTS if name != "deadline"}
+        saved["db_breaker"] = main.db_breaker
+        try:
+            return check(main, db)
+        finally:
+            db.set_faults()
+            for name, value in saved.items():
+                setattr(main, name, value)
+    return run
+
+
+@with_resilience_defaults
+def check_retries(main, db):
+    off = run_variant(main, db, {"error_rate": 0.2}, {"DB_READ_RETRIES": 0}, 200, 8)
+    on = run_variant(main, db, {"error_rate": 0.2}, {"DB_READ_RETRIES": 2}, 200, 8)
+    assert on["success_rate"] >= 0.97, f"{on['success_rate']:.1%} of retried reads succeeded"
+    assert on["success_rate"] > off["success_rate"], f"retries did not help: {off['success_rate']:.1%} -> {on['success_rate']:.1%}"
+    return f"{off['success_rate']:.1%} -> {on['success_rate']:.1%} of reads succeed"
+
+
+@with_resilience_defaults
+def check_breaker(main, db):
+    window, calls, concurrency = 20, 200, 8
+    result = run_variant(main, db, {"down": True}, {"DB_BREAKER_WINDOW": window}, calls, concurrency)
+    # The window has to fill before the breaker opens; calls already in flight may still retry
+    bound = window + concurrency * (1 + RESILIENCE_DEFAULTS["DB_READ_RETRIES"])
+    assert result["server_attempts"] <= bound, f"{result['server_attempts']} attempts reached the server during the outage, expected at most {bound}"
+    return f"{result['server_attempts']} attempts for {calls} reads"
+
+
+@with_resilience_defaults
+def check_deadline(main, db):
+    result = run_variant(main, db, {"stall_rate": 1.0, "stall_ms": 3000}, {"deadline": 0.5}, 16, 8)
+    assert result["max_ms"] <= 1000, f"slowest read took {result['max_ms']} ms under a 0.5 s deadline"
+    return f"slowest read {result['max_ms']} ms"
+
+
+@with_resilience_defaults
+def check_write_retries(main, db):
+    main.DB_READ_RETRIES = 2
+    main.db_breaker = main.CircuitBreaker(10 ** 9, 0.5, 30)
+    db.set_faults(error_rate=1.0)
+    db.reset_stats()
+    writes = [
+        lambda: main.execute_turso_sql("INSERT INTO users (full_name, email) VALUES (?, ?)", ["Retry Check", "retry@example.com"]),
+        lambda: main.execute_turso_transaction([("DELETE FROM daily_activity WHERE device_id = ?", ["RETRY001"])]),
+    ]
+    for write in writes:
+        try:
+            write()
+        except main.DatabaseError:
+            pass
+    attempts = db.stats()["attempts"]
+    assert attempts == len(writes), f"{len(writes)} failed writes took {attempts} attempts"
+    return f"{len(writes)} failed writes, {attempts} attempts"
+
+
+CHECKS = {
+    "cleanup": check_cleanup,
+    "status-poll": check_status_poll,
+    "fleet-batch": check_fleet_batch,
+    "fleet-durable": check_fleet_durable,
+    "batch-atomic": check_batch_atomic,
+    "batch-rate": check_batch_rate,
+    "retries": check_retries,
+    "breaker": check_breaker,
+    "deadline": check_deadline,
+    "write-retries": check_write_retries,
+    "activity-day": check_activity_day,
+    "activity-order": check_activity_order,
+    "report-lease": check_report_lease,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="append", choices=sorted(CHECKS), help="Run only these checks")
+    args = parser.parse_args()
+
+    db = fake_turso.FakeTurso()
+    server, turso_url = fake_turso.start_server(db)
+    os.environ.update(TURSO_DB_URL=turso_url, TURSO_DB_TOKEN="check-token", RATE_LIMIT_ENABLED="false", QUERY_TRACE_ENABLED="false")
+    import main as app_module
+
+    failures = 0
+    try:
+        for name in args.check or list(CHECKS):
+            try:
+                print(f"ok    {name}: {CHECKS[name](app_module, db)}")
+            except AssertionError as e:
+                failures += 1
+                print(f"FAIL  {name}: {e}")
+    finally:
+        server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Local stand-in for the Gemini `generateContent` endpoint.
+
+Run standalone:
+
+    python benchmarks/fake_gemini.py --port 8082 --latency-ms 400
+
+then set `GEMINI_API_URL=http://127.0.0.1:8082/generateContent` and any
+non-empty `GEMINI_API_KEY`.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_REPLY = "Drink water, rest in a quiet room and see a doctor if the headache lasts more than a day."
+
+
+class FakeGemini:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, reply=CANNED_REPLY):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.reply = reply
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def generate(self, body):
+        if self.latency_ms or self.jitter_ms:
+            time.sleep((self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000.0)
+        with self.lock:
+            self.calls += 1
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": self.reply}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": len(json.dumps(body)) // 4, "candidatesTokenCount": len(self.reply) // 4},
+        }
+
+
+def make_handler(gemini):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length)
+            if not self.headers.get("X-goog-api-key"):
+                status, payload = 403, {"error": {"code": 403, "message": "API key missing"}}
+            else:
+                try:
+                    status, payload = 200, gemini.generate(json.loads(raw or b"{}"))
+                except ValueError:
+                    status, payload = 400, {"error": {"code": 400, "message": "Invalid JSON"}}
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def start_server(gemini, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), make_handler(gemini))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/generateContent"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Gemini generateContent stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeGemini(args.latency_ms, args.jitter_ms)))
+    print(f"Fake Gemini listening on http://{args.host}:{args.port}/generateContent")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
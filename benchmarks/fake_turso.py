@@ -0,0 +1,312 @@
+"""Local stand-in for the Turso HTTP API (hrana `/v2/pipeline`) backed by SQLite.
+
+Run standalone:
+
+    python benchmarks/fake_turso.py --port 8081 --latency-ms 20
+
+then point the API at it with `TURSO_DB_URL=http://127.0.0.1:8081` and any
+non-empty `TURSO_DB_TOKEN`. The load test starts it in-process instead.
+
+Pipelines may carry `execute` and `batch` requests; batch steps honour their
+conditions, so a BEGIN ... COMMIT/ROLLBACK batch is applied all or nothing.
+
+Faults can be injected to exercise the client's retries, circuit breaker and
+hedged reads: `--error-rate 0.2` answers a fifth of pipelines with 503,
+`--stall-rate 0.05 --stall-ms 3000` holds some responses back, and
+`POST /_faults` with a JSON body of the same settings (plus `"down": true`)
+changes them while running.
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "schemas")
+
+
+def decode_arg(arg):
+    kind = arg.get("type")
+    if kind == "null":
+        return None
+    if kind == "integer":
+        return int(arg["value"])
+    if kind == "float":
+        return float(arg["value"])
+    if kind == "blob":
+        return base64.b64decode(arg.get("base64", ""))
+    return arg.get("value")
+
+
+def encode_value(value):
+    if value is None:
+        return {"type": "null"}
+    if isinstance(value, bool):
+        return {"type": "integer", "value": str(int(value))}
+    if isinstance(value, int):
+        return {"type": "integer", "value": str(value)}
+    if isinstance(value, float):
+        return {"type": "float", "value": value}
+    if isinstance(value, bytes):
+        return {"type": "blob", "base64": base64.b64encode(value).decode()}
+    return {"type": "text", "value": str(value)}
+
+
+class FakeTurso:
+    """SQLite database plus the counters the benchmarks read back."""
+
+    def __init__(self, path=":memory:", latency_ms=0.0, jitter_ms=0.0, load_schema=True,
+                 error_rate=0.0, error_status=503, stall_rate=0.0, stall_ms=0.0):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.set_faults(error_rate=error_rate, error_status=error_status, stall_rate=stall_rate, stall_ms=stall_ms)
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+        if load_schema:
+            self.load_schema()
+
+    def load_schema(self):
+        for path in sorted(glob.glob(os.path.join(SCHEMA_DIR, "*.sql"))):
+            with open(path) as f:
+                sql = f.read()
+            # Keep tables and indexes, skip the sample rows
+            statements = [s for s in sql.split(";") if s.strip() and "INSERT" not in s.upper()]
+            with self.lock:
+                for statement in statements:
+                    self.conn.execute(statement)
+
+    def set_faults(self, error_rate=0.0, error_status=503, stall_rate=0.0, stall_ms=0.0, down=False):
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self.down = down
+
+    def faults(self):
+        return {
+            "error_rate": self.error_rate,
+            "error_status": self.error_status,
+            "stall_rate": self.stall_rate,
+            "stall_ms": self.stall_ms,
+            "down": self.down,
+        }
+
+    def inject_fault(self):
+        # Returns an HTTP status to fail this pipeline with, or None to serve it
+        with self.stats_lock:
+            self.attempts += 1
+        if self.down or random.random() < self.error_rate:
+            with self.stats_lock:
+                self.injected_errors += 1
+            return self.error_status
+        if self.stall_rate and random.random() < self.stall_rate:
+            with self.stats_lock:
+                self.injected_stalls += 1
+            time.sleep(self.stall_ms / 1000.0)
+        return None
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.round_trips = 0
+            self.statements = 0
+            self.rows_returned = 0
+            self.attempts = 0
+            self.injected_errors = 0
+            self.injected_stalls = 0
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "round_trips": self.round_trips,
+                "statements": self.statements,
+                "rows_returned": self.rows_returned,
+                "attempts": self.attempts,
+                "injected_errors": self.injected_errors,
+                "injected_stalls": self.injected_stalls,
+            }
+
+    def execute(self, stmt):
+        sql = stmt["sql"]
+        args = [decode_arg(a) for a in stmt.get("args", [])]
+        with self.lock:
+            before = self.conn.total_changes
+            cursor = self.conn.execute(sql, args)
+            rows = cursor.fetchall()
+            cols = [{"name": d[0], "decltype": None} for d in (cursor.description or [])]
+            changes = self.conn.total_changes - before
+            last_rowid = cursor.lastrowid
+        return {
+            "cols": cols,
+            "rows": [[encode_value(v) for v in row] for row in rows],
+            "affected_row_count": changes,
+            "last_insert_rowid": str(last_rowid) if last_rowid else None,
+            "rows_read": len(rows),
+            "rows_written": changes,
+        }
+
+    def batch(self, steps):
+        # Steps run in order while the lock is held, each only when its condition
+        # holds on the outcomes so far, so BEGIN ... COMMIT batches are atomic.
+        results = []
+        errors = []
+        with self.lock:
+            for step in steps:
+                if not self.condition_holds(step.get("condition"), results, errors):
+                    results.append(None)
+                    errors.append(None)
+                    continue
+                try:
+                    results.append(self.execute(step["stmt"]))
+                    errors.append(None)
+                except sqlite3.Error as e:
+                    results.append(None)
+                    errors.append({"message": str(e), "code": "SQLITE_ERROR"})
+        return {"step_results": results, "step_errors": errors}
+
+    def condition_holds(self, condition, results, errors):
+        if condition is None:
+            return True
+        kind = condition["type"]
+        if kind == "ok":
+            return results[condition["step"]] is not None
+        if kind == "error":
+            return errors[condition["step"]] is not None
+        if kind == "not":
+            return not self.condition_holds(condition["cond"], results, errors)
+        if kind == "and":
+            return all(self.condition_holds(c, results, errors) for c in condition["conds"])
+        if kind == "or":
+            return any(self.condition_holds(c, results, errors) for c in condition["conds"])
+        if kind == "is_autocommit":
+            return self.conn.in_transaction is False
+        raise ValueError(f"Unsupported condition: {kind}")
+
+    def pipeline(self, body):
+        if self.latency_ms or self.jitter_ms:
+            time.sleep((self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000.0)
+
+        results = []
+        statements = 0
+        rows_returned = 0
+        for request in body.get("requests", []):
+            kind = request.get("type")
+            if kind == "execute":
+                statements += 1
+                try:
+                    result = self.execute(request["stmt"])
+                    rows_returned += len(result["rows"])
+                    results.append({"type": "ok", "response": {"type": "execute", "result": result}})
+                except sqlite3.Error as e:
+                    results.append({"type": "error", "error": {"message": str(e), "code": "SQLITE_ERROR"}})
+            elif kind == "batch":
+                steps = request["batch"]["steps"]
+                statements += len(steps)
+                result = self.batch(steps)
+                rows_returned += sum(len(step["rows"]) for step in result["step_results"] if step)
+                results.append({"type": "ok", "response": {"type": "batch", "result": result}})
+            elif kind == "close":
+                results.append({"type": "ok", "response": {"type": "close"}})
+            else:
+                results.append({"type": "error", "error": {"message": f"Unsupported request type: {kind}"}})
+
+        with self.stats_lock:
+            self.round_trips += 1
+            self.statements += statements
+            self.rows_returned += rows_returned
+
+        return {"baton": None, "base_url": None, "results": results}
+
+
+def make_handler(db):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/_stats":
+                self.send_json(200, db.stats())
+            else:
+                self.send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length)
+            if self.path == "/_reset":
+                db.reset_stats()
+                self.send_json(200, db.stats())
+                return
+            if self.path == "/_faults":
+                try:
+                    db.set_faults(**json.loads(raw or b"{}"))
+                except (ValueError, TypeError):
+                    self.send_json(400, {"error": "Invalid fault settings"})
+                    return
+                self.send_json(200, db.faults())
+                return
+            if self.path != "/v2/pipeline":
+                self.send_json(404, {"error": "Not found"})
+                return
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                self.send_json(401, {"error": "Unauthorized"})
+                return
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError:
+                self.send_json(400, {"error": "Invalid JSON"})
+                return
+            status = db.inject_fault()
+            if status:
+                self.send_json(status, {"error": "Injected fault"})
+                return
+            self.send_json(200, db.pipeline(body))
+
+    return Handler
+
+
+def start_server(db, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), make_handler(db))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Turso /v2/pipeline stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--db", default=":memory:", help="SQLite file (default: in-memory)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of pipelines answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of pipelines delayed by --stall-ms")
+    parser.add_argument("--stall-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    db = FakeTurso(args.db, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                   error_status=args.error_status, stall_rate=args.stall_rate, stall_ms=args.stall_ms)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(db))
+    print(f"Fake Turso listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,163 @@
+"""Parse throughput of the JSON batch and binary frame ingest formats.
+
+Builds the same readings in both formats and measures, per format, how many
+readings per second can be turned into validated HealthMetricCreate objects:
+
+- json:   `json.loads` + pydantic validation of `HealthMetricBatch`, which is
+          what FastAPI does for POST /health-metrics/batch
+- binary: `decode_health_frames`, used by POST /health-metrics/binary
+
+Both apply `validate_health_metric`, the range checks shared by every ingest
+route: JSON per reading, binary on each frame's column minima and maxima.
+Body sizes are reported raw and gzipped.
+
+    python benchmarks/ingest_parse_bench.py --readings 500 --devices 10
+    python benchmarks/ingest_parse_bench.py --output benchmarks/baselines/ingest_parse.json
+
+`encode_health_frame` doubles as the reference encoder for band firmware.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import struct
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from main import (  # noqa: E402
+    FRAME_ACTIVITIES,
+    FRAME_HEADER,
+    FRAME_MAGIC,
+    FRAME_VERSION,
+    HealthMetricBatch,
+    decode_health_frames,
+    validate_health_metric,
+)
+
+
+def encode_health_frame(device_id, readings, utc_offset_minutes=0):
+    """Packs readings (dicts with an aware `time` plus metric fields) into one frame."""
+    base_time = int(min(r["time"] for r in readings).timestamp())
+    ident = device_id.encode("ascii")
+    count = len(readings)
+    activity_codes = {name: code for code, name in enumerate(FRAME_ACTIVITIES) if code}
+    columns = [
+        ("H", [int(r["time"].timestamp()) - base_time for r in readings]),
+        ("B", [r.get("heart_rate") or 0 for r in readings]),
+        ("B", [r.get("spo2") or 0 for r in readings]),
+        ("H", [round(r["temperature"] * 100) if r.get("temperature") is not None else 0 for r in readings]),
+        ("I", [0xFFFFFFFF if r.get("steps") is None else r["steps"] for r in readings]),
+        ("H", [0xFFFF if r.get("calories") is None else r["calories"] for r in readings]),
+        ("B", [activity_codes.get(r.get("activity"), 0) for r in readings]),
+    ]
+    parts = [FRAME_MAGIC, bytes([FRAME_VERSION, len(ident)]), ident, FRAME_HEADER.pack(count, base_time, utc_offset_minutes)]
+    for code, values in columns:
+        parts.append(struct.pack(f"<{count}{code}", *values))
+    return b"".join(parts)
+
+
+def build_readings(total, devices, seed=42):
+    rng = random.Random(seed)
+    tz = timezone(timedelta(hours=2))
+    now = datetime.now(tz).replace(microsecond=0)
+    by_device = {}
+    for i in range(total):
+        device_id = f"BAND{i % devices + 1:04d}"
+        by_device.setdefault(device_id, []).append({
+            "time": now - timedelta(seconds=60 * (total - i)),
+            "heart_rate": rng.randint(55, 140),
+            "spo2": rng.randint(92, 100),
+            "temperature": round(rng.uniform(35.8, 37.8), 2),
+            "steps": rng.randint(0, 20000),
+            "calories": rng.randint(0, 900),
+            "activity": rng.choice(["Walking", "Running", "Resting", "Sleeping", "Cycling"]),
+        })
+    return by_device
+
+
+def json_body(by_device):
+    readings = []
+    for device_id, items in by_device.items():
+        for r in items:
+            fields = {key: value for key, value in r.items() if key != "time"}
+            readings.append({"device_id": device_id, "timestamp": r["time"].isoformat(), **fields})
+    return json.dumps({"readings": readings}).encode()
+
+
+def binary_body(by_device):
+    return b"".join(encode_health_frame(device_id, items, utc_offset_minutes=120) for device_id, items in by_device.items())
+
+
+def parse_json(body):
+    readings = HealthMetricBatch.model_validate(json.loads(body)).readings
+    return [r for r in readings if not validate_health_metric(r)]
+
+
+def parse_binary(body):
+    readings, all_valid = decode_health_frames(body)
+    return readings if all_valid else [r for r in readings if not validate_health_metric(r)]
+
+
+def measure(func, body, readings, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parsed = func(body)
+        timings.append(time.perf_counter() - start)
+    assert len(parsed) == readings
+    median = statistics.median(timings)
+    return {
+        "median_ms": round(median * 1000, 3),
+        "readings_per_sec": round(readings / median),
+        "body_bytes": len(body),
+        "gzip_bytes": len(gzip.compress(body)),
+        "bytes_per_reading": round(len(body) / readings, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=500, help="Readings per request body (max MAX_BATCH_READINGS)")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    by_device = build_readings(args.readings, args.devices)
+    bodies = {"json": json_body(by_device), "binary": binary_body(by_device)}
+
+    # Both formats must decode to the same readings
+    from_json = parse_json(bodies["json"])
+    from_binary = parse_binary(bodies["binary"])
+    key = lambda r: (r.device_id, datetime.fromisoformat(r.timestamp), r.heart_rate, r.spo2, r.temperature, r.steps, r.calories, r.activity)
+    assert sorted(map(key, from_json)) == sorted(map(key, from_binary))
+
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "readings": args.readings,
+        "devices": args.devices,
+        "json": measure(parse_json, bodies["json"], args.readings, args.repeat),
+        "binary": measure(parse_binary, bodies["binary"], args.readings, args.repeat),
+    }
+
+    print(f"{args.readings} readings from {args.devices} bands per body")
+    print(f"{'format':<8} {'median ms':>10} {'readings/s':>12} {'bytes':>8} {'gzip':>8} {'B/reading':>10}")
+    for name in ("json", "binary"):
+        r = results[name]
+        print(f"{name:<8} {r['median_ms']:>10} {r['readings_per_sec']:>12} {r['body_bytes']:>8} {r['gzip_bytes']:>8} {r['bytes_per_reading']:>10}")
+    print(f"binary parses {results['binary']['readings_per_sec'] / results['json']['readings_per_sec']:.1f}x faster")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
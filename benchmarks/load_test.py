@@ -0,0 +1,352 @@
+"""Load-testing harness for main.py.
+
+Starts the fake Turso and Gemini servers, serves the API with uvicorn on a
+local port, seeds a fleet of devices and drives a weighted mix of ingest,
+status polling, dashboard, report and chat traffic against it.
+
+    python benchmarks/load_test.py --duration 30 --concurrency 16 --turso-latency-ms 20
+    python benchmarks/load_test.py --output benchmarks/baselines/default.json
+    python benchmarks/load_test.py --compare benchmarks/baselines/default.json
+
+Per endpoint it reports throughput, p50/p95/p99 latency, error count and the
+number of database round trips a single request makes. `--compare` exits
+non-zero when an endpoint's p95 or throughput regressed past `--max-regression`.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_gemini  # noqa: E402
+import fake_turso  # noqa: E402
+
+ACTIVITIES = ["Walking", "Running", "Resting", "Sleeping", "Cycling"]
+
+
+def reading(device_id, when, rng):
+    return {
+        "device_id": device_id,
+        "timestamp": when.isoformat(),
+        "heart_rate": rng.randint(55, 140),
+        "spo2": rng.randint(92, 100),
+        "temperature": round(rng.uniform(35.8, 37.8), 1),
+        "steps": rng.randint(0, 20000),
+        "calories": rng.randint(0, 900),
+        "activity": rng.choice(ACTIVITIES),
+    }
+
+
+def seed(db, users, devices, readings_per_device, rng):
+    now = datetime.now()
+    with db.lock:
+        conn = db.conn
+        conn.execute("BEGIN")
+        for user_id in range(1, users + 1):
+            conn.execute("INSERT INTO users (id, full_name, email) VALUES (?, ?, ?)", [user_id, f"User {user_id}", f"user{user_id}@example.com"])
+        for n in range(1, devices + 1):
+            conn.execute(
+                "INSERT INTO devices (device_id, user_id, model, status) VALUES (?, ?, ?, ?)",
+                [f"BAND{n:04d}", (n - 1) % users + 1, "BioBand Pro", "active"],
+            )
+            for i in range(readings_per_device):
+                r = reading(f"BAND{n:04d}", now - timedelta(minutes=i * 5), rng)
+                conn.execute(
+                    "INSERT INTO health_metrics (device_id, user_id, heart_rate, spo2, temperature, steps, calories, activity, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [r["device_id"], (n - 1) % users + 1, r["heart_rate"], r["spo2"], r["temperature"], r["steps"], r["calories"], r["activity"], r["timestamp"]],
+                )
+        conn.execute("COMMIT")
+
+
+# Scenario name -> (method, path builder, body builder)
+def scenarios(users, devices):
+    def device(rng):
+        return f"BAND{rng.randint(1, devices):04d}"
+
+    return {
+        "POST /health-metrics/": ("POST", lambda rng: "/health-metrics/", lambda rng: reading(device(rng), datetime.now(), rng)),
+        "GET /health-status/{device_id}": ("GET", lambda rng: f"/health-status/{device(rng)}", None),
+        "GET /dashboard/{user_id}": ("GET", lambda rng: f"/dashboard/{rng.randint(1, users)}", None),
+        "GET /reports/recent/{hours}": ("GET", lambda rng: "/reports/recent/24", None),
+        "GET /reports/device-report/{device_id}": ("GET", lambda rng: f"/reports/device-report/{device(rng)}", None),
+        "GET /reports/latest-entries/{limit}": ("GET", lambda rng: "/reports/latest-entries/10", None),
+        "GET /health-metrics/": ("GET", lambda rng: "/health-metrics/", None),
+        "POST /chat": ("POST", lambda rng: "/chat", lambda rng: {"message": "I have a headache", "session_id": f"bench-{rng.randint(1, 50)}"}),
+    }
+
+
+MIXES = {
+    "default": {
+        "POST /health-metrics/": 50,
+        "GET /health-status/{device_id}": 20,
+        "GET /dashboard/{user_id}": 12,
+        "GET /health-metrics/": 5,
+        "GET /reports/recent/{hours}": 4,
+        "GET /reports/device-report/{device_id}": 4,
+        "GET /reports/latest-entries/{limit}": 3,
+        "POST /chat": 2,
+    },
+    "ingest-heavy": {
+        "POST /health-metrics/": 85,
+        "GET /health-status/{device_id}": 10,
+        "GET /dashboard/{user_id}": 5,
+    },
+    "read-heavy": {
+        "POST /health-metrics/": 10,
+        "GET /health-status/{device_id}": 35,
+        "GET /dashboard/{user_id}": 30,
+        "GET /reports/recent/{hours}": 10,
+        "GET /reports/device-report/{device_id}": 10,
+        "GET /reports/latest-entries/{limit}": 5,
+    },
+}
+
+
+def send(session, base_url, scenario, rng):
+    method, path, body = scenario
+    if method == "POST":
+        return session.post(base_url + path(rng), json=body(rng), timeout=60)
+    return session.get(base_url + path(rng), timeout=60)
+
+
+def is_error(response):
+    if response.status_code >= 400:
+        return True
+    try:
+        payload = response.json()
+    except ValueError:
+        return False
+    return isinstance(payload, dict) and payload.get("success") is False
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def probe_round_trips(db, base_url, names, table, rng):
+    """Issue one request per endpoint on an idle server and count its DB round trips."""
+    trips = {}
+    with requests.Session() as session:
+        for name in names:
+            db.reset_stats()
+            send(session, base_url, table[name], rng)
+            trips[name] = db.stats()["round_trips"]
+    return trips
+
+
+def run_load(base_url, mix, table, duration, concurrency, seed_value):
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        rng = random.Random(seed_value + worker_id)
+        local = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        with requests.Session() as session:
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    failed = is_error(send(session, base_url, table[name], rng))
+                except requests.RequestException:
+                    failed = True
+                local[name].append((time.perf_counter() - start) * 1000.0)
+                if failed:
+                    local_errors[name] += 1
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return samples, errors, elapsed
+
+
+def summarize(samples, errors, elapsed, trips):
+    endpoints = {}
+    all_latencies = []
+    for name, values in samples.items():
+        values.sort()
+        all_latencies.extend(values)
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+            "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "db_round_trips": trips.get(name),
+        }
+    all_latencies.sort()
+    total = {
+        "requests": len(all_latencies),
+        "errors": sum(errors.values()),
+        "throughput_rps": round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(all_latencies, 50), 2),
+        "p95_ms": round(percentile(all_latencies, 95), 2),
+        "p99_ms": round(percentile(all_latencies, 99), 2),
+    }
+    return endpoints, total
+
+
+def print_report(endpoints, total):
+    header = f"{'endpoint':<40} {'reqs':>7} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'db rt':>6}"
+    print(header)
+    print("-" * len(header))
+    for name, s in sorted(endpoints.items()):
+        trips = "-" if s["db_round_trips"] is None else s["db_round_trips"]
+        print(f"{name:<40} {s['requests']:>7} {s['errors']:>5} {s['throughput_rps']:>8} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9} {trips:>6}")
+    print("-" * len(header))
+    print(f"{'TOTAL':<40} {total['requests']:>7} {total['errors']:>5} {total['throughput_rps']:>8} {total['p50_ms']:>9} {total['p95_ms']:>9} {total['p99_ms']:>9}")
+
+
+def compare(current, baseline, max_regression, min_requests):
+    """Print per-endpoint deltas against a saved baseline; return the regressed endpoints.
+
+    Endpoints with fewer than `min_requests` samples on either side are listed
+    but not judged: their p95 is a handful of requests and mostly noise.
+    """
+    regressions = []
+    print(f"\nComparison against baseline ({baseline['meta'].get('commit', 'unknown')}):")
+    for name, now in sorted(current["endpoints"].items()):
+        before = baseline["endpoints"].get(name)
+        if not before or not before["requests"] or not now["requests"]:
+            continue
+        if before.get("db_round_trips") != now.get("db_round_trips"):
+            print(f"  {name:<40} db round trips {before.get('db_round_trips')} -> {now.get('db_round_trips')}")
+        if min(before["requests"], now["requests"]) < min_requests:
+            print(f"  {name:<40} {before['requests']} / {now['requests']} requests, fewer than {min_requests}: not compared")
+            continue
+        p95_change = (now["p95_ms"] - before["p95_ms"]) / before["p95_ms"] if before["p95_ms"] else 0.0
+        rps_change = (now["throughput_rps"] - before["throughput_rps"]) / before["throughput_rps"] if before["throughput_rps"] else 0.0
+        regressed = p95_change > max_regression or rps_change < -max_regression
+        if regressed:
+            regressions.append(name)
+        flag = "REGRESSED" if regressed else "ok"
+        print(f"  {name:<40} p95 {before['p95_ms']:>8} -> {now['p95_ms']:>8} ({p95_change:+.0%})  rps {before['throughput_rps']:>7} -> {now['throughput_rps']:>7} ({rps_change:+.0%})  {flag}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_app(turso_url, gemini_url):
+    os.environ["TURSO_DB_URL"] = turso_url
+    os.environ["TURSO_DB_TOKEN"] = "bench-token"
+    os.environ["GEMINI_API_KEY"] = "bench-key"
+    os.environ["GEMINI_API_URL"] = gemini_url
+    # Every simulated client shares one address; keep admission control out of
+    # the way unless explicitly enabled (RATE_LIMIT_ENABLED=true)
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    sys.path.insert(0, ROOT_DIR)
+
+    import uvicorn
+    import main
+
+    config = uvicorn.Config(main.app, host="127.0.0.1", port=0, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load per run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--readings-per-device", type=int, default=200)
+    parser.add_argument("--turso-latency-ms", type=float, default=10.0)
+    parser.add_argument("--turso-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--gemini-latency-ms", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as a JSON baseline to this path")
+    parser.add_argument("--compare", help="Compare results against this JSON baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed fractional p95/throughput regression (default 0.2)")
+    parser.add_argument("--min-requests", type=int, default=200, help="Endpoints with fewer samples in either run are not compared (default 200)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db = fake_turso.FakeTurso(latency_ms=args.turso_latency_ms, jitter_ms=args.turso_jitter_ms)
+    seed(db, args.users, args.devices, args.readings_per_device, rng)
+    turso_server, turso_url = fake_turso.start_server(db)
+    gemini_server, gemini_url = fake_gemini.start_server(fake_gemini.FakeGemini(args.gemini_latency_ms))
+    app_server, app_thread, base_url = start_app(turso_url, gemini_url)
+
+    try:
+        table = scenarios(args.users, args.devices)
+        mix = MIXES[args.mix]
+        trips = probe_round_trips(db, base_url, list(mix), table, rng)
+        db.reset_stats()
+        samples, errors, elapsed = run_load(base_url, mix, table, args.duration, args.concurrency, args.seed)
+        db_stats = db.stats()
+    finally:
+        app_server.should_exit = True
+        app_thread.join(timeout=5)
+        turso_server.shutdown()
+        gemini_server.shutdown()
+
+    endpoints, total = summarize(samples, errors, elapsed, trips)
+    total["db_round_trips"] = db_stats["round_trips"]
+    total["db_rows_returned"] = db_stats["rows_returned"]
+    print_report(endpoints, total)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "endpoints": endpoints,
+        "total": total,
+    }
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.max_regression, args.min_requests):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Fault-injection checks for the Turso client in main.py.
+
+Runs reads through `execute_turso_sql` against the fake Turso server while it
+injects faults, once with each resilience feature off and once with it on:
+
+- errors:   20% of pipelines answer 503; read retries off vs on
+- stalls:   5% of pipelines stall for 2 s; hedged reads off vs on
+- outage:   every pipeline fails; circuit breaker off vs on
+- deadline: every pipeline stalls for 3 s; no deadline vs a 0.5 s request deadline
+
+This only reports numbers. consistency_check.py runs the same scenarios as
+pass/fail checks (retries, breaker, deadline, write-retries).
+
+    python benchmarks/resilience_bench.py --calls 400 --concurrency 8
+    python benchmarks/resilience_bench.py --output benchmarks/baselines/resilience.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import fake_turso  # noqa: E402
+
+SCENARIOS = {
+    "errors": {
+        "faults": {"error_rate": 0.2},
+        "off": {"DB_READ_RETRIES": 0},
+        "on": {"DB_READ_RETRIES": 2},
+    },
+    "stalls": {
+        "faults": {"stall_rate": 0.05, "stall_ms": 2000},
+        "off": {"DB_HEDGE_AFTER_MS": 0},
+        "on": {"DB_HEDGE_AFTER_MS": 50},
+    },
+    "outage": {
+        "faults": {"down": True},
+        "off": {"DB_BREAKER_WINDOW": 10 ** 9},
+        "on": {"DB_BREAKER_WINDOW": 20},
+    },
+    "deadline": {
+        "faults": {"stall_rate": 1.0, "stall_ms": 3000},
+        "off": {"deadline": None},
+        "on": {"deadline": 0.5},
+    },
+}
+
+DEFAULTS = {
+    "DB_READ_RETRIES": 2,
+    "DB_RETRY_BASE_MS": 20,
+    "DB_HEDGE_AFTER_MS": 0,
+    "DB_BREAKER_WINDOW": 20,
+    "DB_BREAKER_FAILURE_RATE": 0.5,
+    "DB_BREAKER_RESET_SECONDS": 30,
+    "deadline": None,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_variant(main, db, faults, settings, calls, concurrency):
+    settings = dict(DEFAULTS, **settings)
+    for name, value in settings.items():
+        if name != "deadline":
+            setattr(main, name, value)
+    main.db_breaker = main.CircuitBreaker(
+        settings["DB_BREAKER_WINDOW"], settings["DB_BREAKER_FAILURE_RATE"], settings["DB_BREAKER_RESET_SECONDS"]
+    )
+    db.set_faults(**faults)
+    db.reset_stats()
+
+    def one(_):
+        token = None
+        if settings["deadline"] is not None:
+            token = main.request_deadline.set(time.monotonic() + settings["deadline"])
+        start = time.perf_counter()
+        try:
+            main.execute_turso_sql("SELECT id FROM devices WHERE device_id = ?", ["BAND0001"])
+            ok = True
+        except main.DatabaseError:
+            ok = False
+        finally:
+            if token is not None:
+                main.request_deadline.reset(token)
+        return ok, (time.perf_counter() - start) * 1000.0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(calls)))
+    elapsed = time.perf_counter() - started
+    db.set_faults()
+
+    latencies = sorted(ms for _, ms in outcomes)
+    stats = db.stats()
+    return {
+        "success_rate": round(sum(ok for ok, _ in outcomes) / calls, 3),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(latencies[-1], 1),
+        "mean_ms": round(statistics.mean(latencies), 1),
+        "server_attempts": stats["attempts"],
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Run only these scenarios")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    db = fake_turso.FakeTurso()
+    with db.lock:
+        db.conn.execute("INSERT INTO users (id, full_name, email) VALUES (1, 'User 1', 'user1@example.com')")
+        db.conn.execute("INSERT INTO devices (device_id, user_id, model, status) VALUES ('BAND0001', 1, 'BioBand Pro', 'active')")
+    server, turso_url = fake_turso.start_server(db)
+    os.environ.update(TURSO_DB_URL=turso_url, TURSO_DB_TOKEN="bench-token", METRICS_ENABLED="false", QUERY_TRACE_ENABLED="false")
+    import main as app_module
+
+    results = {"created_at": datetime.now().isoformat(), "calls": args.calls, "concurrency": args.concurrency, "scenarios": {}}
+    try:
+        print(f"{'scenario':<10} {'variant':<8} {'success':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'attempts':>9}")
+        for name in args.scenario or list(SCENARIOS):
+            scenario = SCENARIOS[name]
+            results["scenarios"][name] = {}
+            for variant in ("off", "on"):
+                r = run_variant(app_module, db, scenario["faults"], scenario[variant], args.calls, args.concurrency)
+                results["scenarios"][name][variant] = r
+                print(f"{name:<10} {variant:<8} {r['success_rate']:>8} {r['p50_ms']:>9} {r['p99_ms']:>9} {r['max_ms']:>9} {r['server_attempts']:>9}")
+    finally:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Serialization benchmark for large report responses.
+
+Compares FastAPI's default path for a handler that returns a dict
+(`jsonable_encoder` + stdlib `json` via JSONResponse) with returning a
+FastJSONResponse (orjson, no re-encoding) on a report shaped like
+`/reports/recent/{hours}`.
+
+    python benchmarks/serialization_bench.py --rows 50000
+    python benchmarks/serialization_bench.py --rows 50000 --output benchmarks/baselines/serialization.json
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from main import FastJSONResponse, orjson  # noqa: E402
+
+
+def build_report(rows, seed=42):
+    rng = random.Random(seed)
+    now = datetime.now()
+    records = []
+    for i in range(rows):
+        records.append({
+            "device_id": f"BAND{rng.randint(1, 500):04d}",
+            "heart_rate": rng.randint(55, 140),
+            "spo2": rng.randint(92, 100),
+            "temperature": round(rng.uniform(35.8, 37.8), 1),
+            "steps": rng.randint(0, 20000),
+            "calories": rng.randint(0, 900),
+            "activity": rng.choice(["Walking", "Running", "Resting"]),
+            "timestamp": (now - timedelta(seconds=i * 2)).isoformat(),
+        })
+    return {
+        "success": True,
+        "report": {
+            "report_period": "Last 24 hours",
+            "generated_at": now.isoformat(),
+            "summary": {"new_health_records": rows},
+            "recent_health_data": records,
+            "new_users": [],
+            "new_devices": [],
+        },
+    }
+
+
+def default_path(content):
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def fast_path(content):
+    return FastJSONResponse(content).body
+
+
+def measure(func, content, repeat):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        body = func(content)
+        timings.append((time.perf_counter() - start) * 1000.0)
+        del body
+
+    gc.collect()
+    tracemalloc.start()
+    body = func(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "min_ms": round(min(timings), 2),
+        "peak_memory_mb": round(peak / (1024 * 1024), 2),
+        "body_bytes": len(body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    content = build_report(args.rows)
+    assert json.loads(default_path(content)) == json.loads(fast_path(content))
+
+    results = {
+        "rows": args.rows,
+        "orjson": orjson is not None,
+        "created_at": datetime.now().isoformat(),
+        "before (jsonable_encoder + json)": measure(default_path, content, args.repeat),
+        "after (FastJSONResponse)": measure(fast_path, content, args.repeat),
+    }
+
+    print(f"{args.rows} rows, orjson {'installed' if orjson is not None else 'NOT installed (stdlib fallback)'}")
+    print(f"{'path':<36} {'median ms':>10} {'min ms':>10} {'peak MB':>10} {'bytes':>12}")
+    for name in ("before (jsonable_encoder + json)", "after (FastJSONResponse)"):
+        r = results[name]
+        print(f"{name:<36} {r['median_ms']:>10} {r['min_ms']:>10} {r['peak_memory_mb']:>10} {r['body_bytes']:>12}")
+    before = results["before (jsonable_encoder + json)"]["median_ms"]
+    after = results["after (FastJSONResponse)"]["median_ms"]
+    if after:
+        print(f"speedup: {before / after:.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
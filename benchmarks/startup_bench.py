@@ -0,0 +1,144 @@
+"""Cold-start benchmark.
+
+Spawns fresh Python processes, as a new Vercel instance would, and measures
+for each one:
+
+- interpreter start until `main` can be imported
+- `import main` (module import and app construction)
+- the first request without database work (`GET /health`)
+- the first request that reaches Turso (`GET /health-status/{device_id}`),
+  which pays for any lazily initialised HTTP client
+
+Requests are sent straight to the ASGI app so no HTTP client library is
+imported into the measured process. Turso is the local stand-in from
+fake_turso.py.
+
+    python benchmarks/startup_bench.py --runs 10
+    python benchmarks/startup_bench.py --runs 10 --output benchmarks/baselines/startup.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+
+async def call(app, method, path):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 80),
+    }
+    await app(scope, receive, send)
+    return messages[0]["status"]
+
+
+def child(spawned_at):
+    """Runs inside the measured process and prints its timings as JSON."""
+    ready = time.time()
+    sys.path.insert(0, ROOT_DIR)
+
+    start = time.perf_counter()
+    import main
+    import_ms = (time.perf_counter() - start) * 1000.0
+    modules_loaded = len(sys.modules)
+
+    start = time.perf_counter()
+    asyncio.run(call(main.app, "GET", "/health"))
+    first_request_ms = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    asyncio.run(call(main.app, "GET", "/health-status/BAND0001"))
+    first_db_request_ms = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    asyncio.run(call(main.app, "GET", "/health-status/BAND0001"))
+    warm_db_request_ms = (time.perf_counter() - start) * 1000.0
+
+    print(json.dumps({
+        "interpreter_ms": (ready - spawned_at) * 1000.0,
+        "import_ms": import_ms,
+        "first_request_ms": first_request_ms,
+        "first_db_request_ms": first_db_request_ms,
+        "warm_db_request_ms": warm_db_request_ms,
+        "modules_loaded": modules_loaded,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--turso-latency-ms", type=float, default=0.0)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child)
+        return
+
+    sys.path.insert(0, BENCH_DIR)
+    import fake_turso
+
+    db = fake_turso.FakeTurso(latency_ms=args.turso_latency_ms)
+    server, turso_url = fake_turso.start_server(db)
+    env = dict(os.environ, TURSO_DB_URL=turso_url, TURSO_DB_TOKEN="bench-token", GEMINI_API_KEY="bench-key")
+
+    runs = []
+    try:
+        for _ in range(args.runs):
+            spawned_at = time.time()
+            output = subprocess.check_output([sys.executable, __file__, "--child", repr(spawned_at)], env=env, cwd=ROOT_DIR)
+            run = json.loads(output.decode().strip().splitlines()[-1])
+            run["cold_start_total_ms"] = run["interpreter_ms"] + run["import_ms"] + run["first_request_ms"] + run["first_db_request_ms"]
+            runs.append(run)
+    finally:
+        server.shutdown()
+
+    keys = ["interpreter_ms", "import_ms", "first_request_ms", "first_db_request_ms", "warm_db_request_ms", "cold_start_total_ms"]
+    summary = {key: round(statistics.median(run[key] for run in runs), 2) for key in keys}
+    summary["modules_loaded"] = runs[-1]["modules_loaded"]
+
+    print(f"{args.runs} cold starts (median)")
+    for key in keys + ["modules_loaded"]:
+        print(f"  {key:<22} {summary[key]:>10}")
+
+    if args.output:
+        results = {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "runs": args.runs,
+            "median": summary,
+        }
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+-- Activity Sessions Table
+-- Runs of consecutive readings with the same activity per device, maintained
+-- incrementally on ingest. Only a device's latest session is ever updated.
+-- Timestamps are UTC instants. last_steps/last_calories hold the counter values
+-- of the session's latest reading and are the baseline for the next one.
+CREATE TABLE IF NOT EXISTS activity_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT NOT NULL,
+    activity TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    start_ts TEXT NOT NULL,
+    end_ts TEXT NOT NULL,
+    readings INTEGER NOT NULL DEFAULT 1,
+    steps INTEGER NOT NULL DEFAULT 0,
+    calories INTEGER NOT NULL DEFAULT 0,
+    last_steps INTEGER,
+    last_calories INTEGER,
+    hr_count INTEGER NOT NULL DEFAULT 0,
+    hr_sum INTEGER NOT NULL DEFAULT 0,
+    hr_min INTEGER,
+    hr_max INTEGER,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_activity_sessions_device_end ON activity_sessions(device_id, end_ts);
+CREATE INDEX IF NOT EXISTS idx_activity_sessions_device_start ON activity_sessions(device_id, start_ts);
@@ -0,0 +1,23 @@
+-- Daily Activity Table
+-- Per-device, per-UTC-day step and calorie totals maintained incrementally on ingest.
+-- steps/calories on each reading are cumulative counters. Totals add the positive
+-- deltas between consecutive readings and treat a drop as a counter reset.
+CREATE TABLE IF NOT EXISTS daily_activity (
+    device_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    steps INTEGER NOT NULL DEFAULT 0,
+    calories INTEGER NOT NULL DEFAULT 0,
+    base_steps INTEGER,
+    base_calories INTEGER,
+    first_ts TEXT NOT NULL,
+    first_steps INTEGER,
+    first_calories INTEGER,
+    last_ts TEXT NOT NULL,
+    last_steps INTEGER,
+    last_calories INTEGER,
+    readings INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (device_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_activity_day ON daily_activity(day);
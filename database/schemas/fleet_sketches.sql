@@ -0,0 +1,13 @@
+-- Fleet Sketches Table
+-- Mergeable per-bucket summaries (value histograms + HyperLogLog) written by each API instance.
+-- /fleet/stats merges every row in the requested window. Rows past FLEET_RETENTION_DAYS are deleted on ingest.
+CREATE TABLE IF NOT EXISTS fleet_sketches (
+    bucket_start TEXT NOT NULL,
+    instance_id TEXT NOT NULL,
+    readings INTEGER NOT NULL,
+    sketch TEXT NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (bucket_start, instance_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_fleet_sketches_bucket ON fleet_sketches(bucket_start);
@@ -0,0 +1,18 @@
+-- Report Snapshots Table
+-- Hot report variants built ahead of time by whichever API instance holds the
+-- "report-snapshots" lease. Every instance serves them from here.
+CREATE TABLE IF NOT EXISTS report_snapshots (
+    report_key TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    generated_at REAL NOT NULL,
+    generated_by TEXT
+);
+
+-- Scheduler Leases Table
+-- One row per background job. An instance may run the job while it holds an
+-- unexpired lease (expires_at in Unix seconds).
+CREATE TABLE IF NOT EXISTS scheduler_leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
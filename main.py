@@ -1,11 +1,39 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
-import requests
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from contextvars import ContextVar
+from collections import OrderedDict, deque, namedtuple
+from email.utils import formatdate, parsedate_to_datetime
+import base64
+import bisect
+import csv
+import hashlib
+import io
+import math
+import logging
+import random
+import threading
+import time
 import json
 import os
+import struct
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = FastAPI(title="Bio Band Health Monitoring API", version="3.0.0")
 
@@ -13,40 +41,948 @@ app = FastAPI(title="Bio Band Health Monitoring API", version="3.0.0")
 DATABASE_URL = os.getenv("TURSO_DB_URL")
 DATABASE_TOKEN = os.getenv("TURSO_DB_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_API_URL = os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent")
 
-def execute_turso_sql(sql, params=None):
-    if not DATABASE_TOKEN:
-        raise Exception("Database token not configured")
+def env_flag(name, default):
+    return os.getenv(name, default).lower() not in ("0", "false", "no", "off")
+
+METRICS_ENABLED = env_flag("METRICS_ENABLED", "true")
+QUERY_TRACE_ENABLED = env_flag("QUERY_TRACE_ENABLED", "true")
+DEBUG_TRACE_ENABLED = env_flag("DEBUG_TRACE_ENABLED", "false")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_SAMPLE_RATE", "1.0"))
+RATE_LIMIT_ENABLED = env_flag("RATE_LIMIT_ENABLED", "true")
+
+# Metrics (Prometheus text format, served on /metrics)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+SQL_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE", "CREATE", "DROP")
+
+METRIC_DEFINITIONS = {
+    "http_requests_total": ("counter", "HTTP requests by route and status code", None),
+    "http_request_errors_total": ("counter", "HTTP requests that failed (5xx or success=false)", None),
+    "http_requests_in_flight": ("gauge", "HTTP requests currently being handled", None),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency", LATENCY_BUCKETS),
+    "http_request_db_round_trips": ("histogram", "Database round trips made per HTTP request", ROUND_TRIP_BUCKETS),
+    "db_query_duration_seconds": ("histogram", "Turso query latency", LATENCY_BUCKETS),
+    "db_query_rows": ("histogram", "Rows returned per Turso query", ROW_BUCKETS),
+    "db_response_bytes": ("histogram", "Turso response payload size", BYTE_BUCKETS),
+    "db_errors_total": ("counter", "Failed Turso queries by error kind", None),
+    "http_requests_rejected_total": ("counter", "Requests rejected with 429 by rate limits and bulkheads", None),
+    "db_retries_total": ("counter", "Turso read retries by error kind", None),
+    "db_hedged_requests_total": ("counter", "Hedged Turso reads sent and won", None),
+    "db_circuit_state": ("gauge", "Turso circuit breaker state (0 closed, 1 half-open, 2 open)", None),
+    "device_registry_lookups_total": ("counter", "Device owner lookups answered from memory (hit) or the database (miss)", None),
+    "report_snapshot_lookups_total": ("counter", "Hot report requests served from a snapshot (hit) or computed live (miss)", None),
+}
+
+metrics_lock = threading.Lock()
+metric_values = {name: {} for name in METRIC_DEFINITIONS}
+request_db_stats = ContextVar("request_db_stats", default=None)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def inc_metric(name, labels, amount=1):
+    with metrics_lock:
+        values = metric_values[name]
+        values[labels] = values.get(labels, 0) + amount
+
+def set_metric(name, labels, value):
+    with metrics_lock:
+        metric_values[name][labels] = value
+
+def observe_metric(name, labels, value):
+    with metrics_lock:
+        values = metric_values[name]
+        histogram = values.get(labels)
+        if histogram is None:
+            histogram = values[labels] = Histogram(METRIC_DEFINITIONS[name][2])
+        histogram.observe(value)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels):
+    return ",".join(f'{key}="{escape_label(value)}"' for key, value in labels)
+
+def render_metrics():
+    lines = []
+    with metrics_lock:
+        for name, (kind, help_text, buckets) in METRIC_DEFINITIONS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in metric_values[name].items():
+                label_text = format_labels(labels)
+                if kind != "histogram":
+                    lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+                    continue
+                prefix = label_text + "," if label_text else ""
+                cumulative = 0
+                for bound, count in zip(buckets, value.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {value.count}')
+                lines.append(f"{name}_sum{{{label_text}}} {value.sum}")
+                lines.append(f"{name}_count{{{label_text}}} {value.count}")
+    return "\n".join(lines) + "\n"
+
+def sql_operation(sql):
+    operation = sql.lstrip()[:6].upper()
+    return operation if operation in SQL_OPERATIONS else "OTHER"
+
+def count_rows(result):
+    return sum(len(item.get("response", {}).get("result", {}).get("rows", [])) for item in result.get("results", []))
+
+def record_db_query(sql, duration, result=None, response_bytes=0, error=None):
+    operation = sql_operation(sql)
+    labels = (("operation", operation),)
+    observe_metric("db_query_duration_seconds", labels, duration)
+    if error is not None:
+        inc_metric("db_errors_total", labels + (("kind", getattr(error, "kind", "other")),))
+    else:
+        for item in result.get("results", []):
+            if item.get("type") == "error":
+                inc_metric("db_errors_total", labels + (("kind", "sql"),))
+        observe_metric("db_query_rows", labels, count_rows(result))
+        observe_metric("db_response_bytes", labels, response_bytes)
+
+    stats = request_db_stats.get()
+    if stats is not None:
+        stats["round_trips"] += 1
+
+# Query tracing and slow-query log
+MAX_TRACE_QUERIES = 500
+TRACE_HISTORY = 200
+REPEATED_QUERY_THRESHOLD = 3
+
+logger = logging.getLogger("bioband")
+slow_query_logger = logging.getLogger("bioband.slow_query")
+request_trace = ContextVar("request_trace", default=None)
+traces_lock = threading.Lock()
+recent_traces = OrderedDict()
+
+def trace_db_query(sql, duration, result=None, response_bytes=0, error=None):
+    duration_ms = round(duration * 1000, 2)
+    rows = count_rows(result) if result is not None else 0
+    trace = request_trace.get()
+    if trace is not None:
+        trace["query_count"] += 1
+        trace["db_time_ms"] = round(trace["db_time_ms"] + duration_ms, 2)
+        trace["rows_returned"] += rows
+        trace["response_bytes"] += response_bytes
+        if len(trace["queries"]) < MAX_TRACE_QUERIES:
+            trace["queries"].append({
+                "sql": sql,
+                "duration_ms": duration_ms,
+                "rows": rows,
+                "response_bytes": response_bytes,
+                "error": str(error) if error is not None else None
+            })
     
+    if duration_ms >= SLOW_QUERY_MS and random.random() < SLOW_QUERY_SAMPLE_RATE:
+        slow_query_logger.warning(json.dumps({
+            "event": "slow_query",
+            "sql": sql,
+            "duration_ms": duration_ms,
+            "rows": rows,
+            "response_bytes": response_bytes,
+            "error": str(error) if error is not None else None,
+            "request_id": trace["request_id"] if trace else None,
+            "path": trace["path"] if trace else None
+        }))
+
+def summarize_trace(trace):
+    counts = {}
+    for query in trace["queries"]:
+        counts[query["sql"]] = counts.get(query["sql"], 0) + 1
+    summary = {key: value for key, value in trace.items() if key != "queries"}
+    summary["repeated_queries"] = [
+        {"sql": sql, "count": count}
+        for sql, count in sorted(counts.items(), key=lambda item: -item[1])
+        if count >= REPEATED_QUERY_THRESHOLD
+    ]
+    summary["largest_query_rows"] = max((query["rows"] for query in trace["queries"]), default=0)
+    return summary
+
+# HTTP client, created on first use. `requests` costs ~70 ms to import, so it
+# stays off the cold-start path of requests that never reach Turso or Gemini,
+# and the pooled session keeps connections open between queries.
+http_session = None
+http_session_lock = threading.Lock()
+
+def get_http_session():
+    global http_session
+    if http_session is None:
+        with http_session_lock:
+            if http_session is None:
+                import requests
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                http_session = session
+    return http_session
+
+class DatabaseError(Exception):
+    def __init__(self, message, kind="other", status=None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+
+# Resilience
+# Reads (SELECT) are idempotent, so transient failures (timeouts, dropped
+# connections, 429/5xx) are retried with capped exponential backoff and full
+# jitter. Writes get a single attempt. A circuit breaker opens when at least
+# DB_BREAKER_FAILURE_RATE of the last DB_BREAKER_WINDOW attempts failed
+# transiently, then fails calls fast until a probe succeeds
+# DB_BREAKER_RESET_SECONDS later. With DB_HEDGE_AFTER_MS set, a read that has
+# not answered in that time is sent a second time and the first answer wins;
+# hedging is skipped while the hedge pool is full. Every attempt is bounded by
+# the request deadline.
+DB_TIMEOUT_SECONDS = float(os.getenv("DB_TIMEOUT_SECONDS", "10"))
+DB_READ_RETRIES = int(os.getenv("DB_READ_RETRIES", "2"))
+DB_RETRY_BASE_MS = float(os.getenv("DB_RETRY_BASE_MS", "50"))
+DB_RETRY_MAX_MS = float(os.getenv("DB_RETRY_MAX_MS", "1000"))
+DB_BREAKER_WINDOW = int(os.getenv("DB_BREAKER_WINDOW", "20"))
+DB_BREAKER_FAILURE_RATE = float(os.getenv("DB_BREAKER_FAILURE_RATE", "0.5"))
+DB_BREAKER_RESET_SECONDS = float(os.getenv("DB_BREAKER_RESET_SECONDS", "30"))
+DB_HEDGE_AFTER_MS = float(os.getenv("DB_HEDGE_AFTER_MS", "0"))
+DB_HEDGE_WORKERS = int(os.getenv("DB_HEDGE_WORKERS", "32"))
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "10"))
+REPORT_DEADLINE_SECONDS = float(os.getenv("REPORT_DEADLINE_SECONDS", "30"))
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "35"))
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+request_deadline = ContextVar("request_deadline", default=None)
+
+def deadline_for(method, path):
+    # Seconds a request may spend, or None for no deadline (streamed exports)
+    if path.startswith("/export/"):
+        return None
+    if method == "POST" and path == "/chat":
+        return CHAT_DEADLINE_SECONDS
+    if path.startswith(("/reports/", "/fleet/", "/data-validation/", "/data-cleanup/")):
+        return REPORT_DEADLINE_SECONDS
+    return REQUEST_DEADLINE_SECONDS
+
+def deadline_timeout(limit):
+    # Timeout for the next outbound call: `limit`, cut short by the request deadline
+    deadline = request_deadline.get()
+    if deadline is None:
+        return limit
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DatabaseError("Request deadline exceeded", "deadline")
+    return min(limit, remaining)
+
+class CircuitBreaker:
+    def __init__(self, window, failure_rate, reset_seconds):
+        self.window = window
+        self.failure_rate = failure_rate
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def set_state(self, state):
+        self.state = state
+        if METRICS_ENABLED:
+            set_metric("db_circuit_state", (), CIRCUIT_STATES[state])
+
+    def allow(self):
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.set_state("half_open")
+                self.probing = False
+            if self.state == "half_open" and not self.probing:
+                # Let one probe through; everyone else keeps failing fast
+                self.probing = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self.lock:
+            self.probing = False
+            self.outcomes.append(ok)
+            if ok:
+                if self.state != "closed":
+                    self.outcomes.clear()
+                    self.set_state("closed")
+                return
+            failures = self.outcomes.count(False)
+            tripped = len(self.outcomes) >= self.window and failures >= self.failure_rate * self.window
+            if self.state == "half_open" or (self.state == "closed" and tripped):
+                if self.state == "closed":
+                    logger.warning(json.dumps({"event": "db_circuit_open", "failures": failures, "window": len(self.outcomes)}))
+                self.opened_at = time.monotonic()
+                self.set_state("open")
+
+db_breaker = CircuitBreaker(DB_BREAKER_WINDOW, DB_BREAKER_FAILURE_RATE, DB_BREAKER_RESET_SECONDS)
+hedge_executor = None
+hedge_executor_lock = threading.Lock()
+hedges_in_flight = 0
+
+def get_hedge_executor():
+    global hedge_executor
+    if hedge_executor is None:
+        with hedge_executor_lock:
+            if hedge_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                hedge_executor = ThreadPoolExecutor(max_workers=DB_HEDGE_WORKERS, thread_name_prefix="db-hedge")
+    return hedge_executor
+
+def is_read_query(sql):
+    return sql_operation(sql) == "SELECT"
+
+def is_transient(error):
+    return error.kind in ("timeout", "connection") or (error.kind == "http" and error.status in TRANSIENT_STATUSES)
+
+def retry_delay(attempt):
+    return random.uniform(0, min(DB_RETRY_MAX_MS, DB_RETRY_BASE_MS * (2 ** attempt))) / 1000.0
+
+def turso_args(params):
+    # Convert params to proper Turso format
+    turso_params = []
+    for param in params:
+        if param is None:
+            turso_params.append({"type": "null", "value": None})
+        elif isinstance(param, str):
+            turso_params.append({"type": "text", "value": param})
+        elif isinstance(param, int):
+            turso_params.append({"type": "integer", "value": str(param)})
+        elif isinstance(param, float):
+            turso_params.append({"type": "float", "value": param})
+        else:
+            turso_params.append({"type": "text", "value": str(param)})
+    return turso_params
+
+def post_pipeline(data, timeout):
+    # One HTTP attempt. Returns (result, response size) or raises DatabaseError
     headers = {
         "Authorization": f"Bearer {DATABASE_TOKEN}",
         "Content-Type": "application/json"
     }
+    try:
+        response = get_http_session().post(f"{DATABASE_URL}/v2/pipeline", headers=headers, json=data, timeout=timeout)
+        if response.status_code != 200:
+            raise DatabaseError(f"Database error: {response.status_code} - {response.text}", "http", response.status_code)
+        return response.json(), len(response.content)
+    except Exception as e:
+        import requests
+        if isinstance(e, requests.Timeout):
+            kind = "timeout"
+        elif isinstance(e, requests.ConnectionError):
+            kind = "connection"
+        elif isinstance(e, ValueError):
+            kind = "decode"
+        else:
+            kind = getattr(e, "kind", "other")
+        raise DatabaseError(f"Database connection failed: {str(e)}", kind, getattr(e, "status", None))
+
+def submit_hedge_attempt(data, timeout):
+    # Returns a future for one attempt on the hedge pool, or None when the pool is full
+    global hedges_in_flight
+    with hedge_executor_lock:
+        if hedges_in_flight >= DB_HEDGE_WORKERS:
+            return None
+        hedges_in_flight += 1
+    future = get_hedge_executor().submit(post_pipeline, data, timeout)
+    future.add_done_callback(finish_hedge_attempt)
+    return future
+
+def finish_hedge_attempt(future):
+    global hedges_in_flight
+    with hedge_executor_lock:
+        hedges_in_flight -= 1
+
+def post_pipeline_hedged(data, timeout):
+    from concurrent.futures import FIRST_COMPLETED, wait
+    started = time.monotonic()
+    primary = submit_hedge_attempt(data, timeout)
+    if primary is None:
+        return post_pipeline(data, timeout)
+    done, pending = wait([primary], timeout=DB_HEDGE_AFTER_MS / 1000.0)
+    hedge = None if done else submit_hedge_attempt(data, timeout)
+    if hedge is not None:
+        pending.add(hedge)
+        if METRICS_ENABLED:
+            inc_metric("db_hedged_requests_total", (("outcome", "sent"),))
     
-    data = {"requests": [{"type": "execute", "stmt": {"sql": sql}}]}
+    first_error = None
+    while True:
+        for future in done:
+            try:
+                outcome = future.result()
+            except DatabaseError as e:
+                first_error = first_error or e
+                continue
+            if future is not primary and METRICS_ENABLED:
+                inc_metric("db_hedged_requests_total", (("outcome", "won"),))
+            return outcome
+        if not pending:
+            raise first_error
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            raise DatabaseError("Database connection failed: hedged read timed out", "timeout")
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+def call_turso(data, idempotent):
+    attempts = 1 + (DB_READ_RETRIES if idempotent else 0)
+    hedge = idempotent and DB_HEDGE_AFTER_MS > 0
+    for attempt in range(attempts):
+        timeout = deadline_timeout(DB_TIMEOUT_SECONDS)
+        if not db_breaker.allow():
+            raise DatabaseError("Database unavailable: circuit breaker open", "circuit_open")
+        try:
+            outcome = post_pipeline_hedged(data, timeout) if hedge else post_pipeline(data, timeout)
+        except DatabaseError as e:
+            transient = is_transient(e)
+            db_breaker.record(not transient)
+            if not transient or attempt + 1 >= attempts:
+                raise
+            delay = retry_delay(attempt)
+            deadline = request_deadline.get()
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            if METRICS_ENABLED:
+                inc_metric("db_retries_total", (("kind", e.kind),))
+            time.sleep(delay)
+            continue
+        db_breaker.record(True)
+        return outcome
+
+def execute_turso_sql(sql, params=None, idempotent=None):
+    return execute_turso_pipeline([(sql, params)], idempotent)
+
+def turso_stmt(sql, params=None):
+    stmt = {"sql": sql}
     if params:
-        # Convert params to proper Turso format
-        turso_params = []
-        for param in params:
-            if param is None:
-                turso_params.append({"type": "null", "value": None})
-            elif isinstance(param, str):
-                turso_params.append({"type": "text", "value": param})
-            elif isinstance(param, int):
-                turso_params.append({"type": "integer", "value": str(param)})
-            elif isinstance(param, float):
-                turso_params.append({"type": "float", "value": param})
-            else:
-                turso_params.append({"type": "text", "value": str(param)})
-        data["requests"][0]["stmt"]["args"] = turso_params
+        stmt["args"] = turso_args(params)
+    return stmt
+
+def execute_turso_pipeline(statements, idempotent=None):
+    # Runs (sql, params) statements in order in one round trip; each gets its own entry in "results"
+    if idempotent is None:
+        idempotent = all(is_read_query(sql) for sql, _ in statements)
+    return send_turso_requests([{"type": "execute", "stmt": turso_stmt(sql, params)} for sql, params in statements], statements, idempotent)
+
+def execute_turso_transaction(statements):
+    # Runs (sql, params) statements as one transaction in one round trip: a
+    # hrana batch where each step runs only if the step before it succeeded,
+    # and anything short of a COMMIT is rolled back. Returns the statements'
+    # results; raises DatabaseError with the first failure.
+    steps = [{"stmt": {"sql": "BEGIN"}}]
+    for sql, params in statements:
+        steps.append({"stmt": turso_stmt(sql, params), "condition": {"type": "ok", "step": len(steps) - 1}})
+    commit = len(steps)
+    steps.append({"stmt": {"sql": "COMMIT"}, "condition": {"type": "ok", "step": commit - 1}})
+    steps.append({"stmt": {"sql": "ROLLBACK"}, "condition": {"type": "not", "cond": {"type": "ok", "step": commit}}})
+    
+    result = send_turso_requests([{"type": "batch", "batch": {"steps": steps}}], statements, False)
+    item = (result.get("results") or [{}])[0]
+    if item.get("type") != "ok":
+        raise DatabaseError(f"Transaction failed: {item.get('error', {}).get('message', 'no response')}", "sql")
+    batch = item["response"]["result"]
+    if batch["step_results"][commit] is None:
+        message = next((error.get("message") for error in batch["step_errors"] if error), "not committed")
+        raise DatabaseError(f"Transaction failed: {message}", "sql")
+    return batch["step_results"][1:commit]
+
+def send_turso_requests(requests_list, statements, idempotent):
+    if not DATABASE_TOKEN:
+        raise Exception("Database token not configured")
+    
+    data = {"requests": requests_list}
+    sql = statements[0][0] if len(statements) == 1 else f"{statements[0][0]} (+{len(statements) - 1} more statements)"
     
+    start = time.perf_counter()
     try:
-        response = requests.post(f"{DATABASE_URL}/v2/pipeline", headers=headers, json=data, timeout=10)
-        if response.status_code != 200:
-            raise Exception(f"Database error: {response.status_code} - {response.text}")
-        return response.json()
-    except Exception as e:
-        raise Exception(f"Database connection failed: {str(e)}")
+        result, response_bytes = call_turso(data, idempotent)
+    except DatabaseError as error:
+        duration = time.perf_counter() - start
+        if METRICS_ENABLED:
+            record_db_query(sql, duration, error=error)
+        if QUERY_TRACE_ENABLED:
+            trace_db_query(sql, duration, error=error)
+        raise
+    
+    duration = time.perf_counter() - start
+    if METRICS_ENABLED:
+        record_db_query(sql, duration, result=result, response_bytes=response_bytes)
+    if QUERY_TRACE_ENABLED:
+        trace_db_query(sql, duration, result=result, response_bytes=response_bytes)
+    return result
+
+def decode_turso_value(cell):
+    if not isinstance(cell, dict):
+        return cell
+    kind = cell.get("type")
+    if kind == "null":
+        return None
+    if kind == "integer":
+        return int(cell["value"])
+    if kind == "float":
+        return float(cell["value"])
+    if kind == "blob":
+        return base64.b64decode(cell.get("base64", ""))
+    return cell.get("value")
+
+def turso_rows(result):
+    # Rows of the first statement as plain Python values
+    if not (result.get("results") and result["results"][0].get("response", {}).get("result", {}).get("rows")):
+        return []
+    return [[decode_turso_value(cell) for cell in row] for row in result["results"][0]["response"]["result"]["rows"]]
+
+def resolve_route(scope):
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        labels = (("method", scope["method"]), ("route", resolve_route(scope)))
+        response = {"status": 500, "failed": False}
+        
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body" and not response["failed"]:
+                response["failed"] = b'"success":false' in message.get("body", b"")[:256]
+            await send(message)
+        
+        stats = {"round_trips": 0}
+        token = request_db_stats.set(stats)
+        inc_metric("http_requests_in_flight", labels)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            duration = time.perf_counter() - start
+            request_db_stats.reset(token)
+            inc_metric("http_requests_in_flight", labels, -1)
+            inc_metric("http_requests_total", labels + (("status", str(response["status"])),))
+            if response["status"] >= 500 or response["failed"]:
+                inc_metric("http_request_errors_total", labels)
+            observe_metric("http_request_duration_seconds", labels, duration)
+            observe_metric("http_request_db_round_trips", labels, stats["round_trips"])
+
+class QueryTraceMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        request_id = ""
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+        trace = {
+            "request_id": request_id or os.urandom(8).hex(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "started_at": datetime.now().isoformat(),
+            "status": None,
+            "duration_ms": None,
+            "query_count": 0,
+            "db_time_ms": 0.0,
+            "rows_returned": 0,
+            "response_bytes": 0,
+            "queries": []
+        }
+        
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                trace["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", trace["request_id"].encode("latin-1")))
+                if DEBUG_TRACE_ENABLED:
+                    headers.append((b"x-db-query-count", str(trace["query_count"]).encode()))
+                    headers.append((b"x-db-time-ms", str(trace["db_time_ms"]).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        token = request_trace.set(trace)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            request_trace.reset(token)
+            trace["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            if DEBUG_TRACE_ENABLED and not scope["path"].startswith("/debug/traces"):
+                with traces_lock:
+                    recent_traces[trace["request_id"]] = trace
+                    while len(recent_traces) > TRACE_HISTORY:
+                        recent_traces.popitem(last=False)
+
+# Admission control
+# Token buckets cap the request rate per client and the reading rate per band;
+# bulkheads cap how many requests of each kind run at once so an ingest flood
+# cannot take every threadpool worker from dashboards and reports. Requests
+# over a limit get an immediate 429 with Retry-After instead of queueing.
+# Limits are per process.
+class TokenBuckets:
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, cost=1):
+        # Returns 0 when admitted, otherwise seconds until `cost` tokens are available
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / self.rate if self.rate > 0 else 60.0
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+class Bulkhead:
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        with self.lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+
+device_rate_limits = TokenBuckets(float(os.getenv("DEVICE_RATE_PER_SEC", "2")), float(os.getenv("DEVICE_BURST", "20")))
+client_rate_limits = TokenBuckets(float(os.getenv("CLIENT_RATE_PER_SEC", "20")), float(os.getenv("CLIENT_BURST", "100")))
+bulkheads = {
+    "ingest": Bulkhead("ingest", int(os.getenv("BULKHEAD_INGEST", "16"))),
+    "reads": Bulkhead("reads", int(os.getenv("BULKHEAD_READS", "16"))),
+    "reports": Bulkhead("reports", int(os.getenv("BULKHEAD_REPORTS", "4"))),
+    "chat": Bulkhead("chat", int(os.getenv("BULKHEAD_CHAT", "4")))
+}
+UNLIMITED_PATHS = ("/health", "/metrics")
+
+def bulkhead_for(method, path):
+    if method == "POST" and path.startswith("/health-metrics"):
+        return bulkheads["ingest"]
+    if method == "POST" and path == "/chat":
+        return bulkheads["chat"]
+    if path.startswith(("/reports/", "/export/", "/fleet/", "/data-validation/", "/data-cleanup/")):
+        return bulkheads["reports"]
+    return bulkheads["reads"]
+
+def client_address(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"x-forwarded-for":
+            return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def rate_limited_response(wait, reason):
+    retry_after = max(1, math.ceil(wait))
+    if METRICS_ENABLED:
+        inc_metric("http_requests_rejected_total", (("reason", reason),))
+    return JSONResponse(
+        {"success": False, "error": "Too many requests", "reason": reason, "retry_after": retry_after},
+        status_code=429,
+        headers={"Retry-After": str(retry_after)}
+    )
+
+def check_device_rate(device_id, readings=1, limits=device_rate_limits, reason="device_rate"):
+    # Returns a 429 response when the band is over its reading budget, else None
+    if not RATE_LIMIT_ENABLED:
+        return None
+    wait = limits.take(device_id, readings)
+    return rate_limited_response(wait, reason) if wait else None
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNLIMITED_PATHS or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        
+        wait = client_rate_limits.take(client_address(scope))
+        if wait:
+            await rate_limited_response(wait, "client_rate")(scope, receive, send)
+            return
+        
+        bulkhead = bulkhead_for(scope["method"], scope["path"])
+        if not bulkhead.try_acquire():
+            await rate_limited_response(1, f"bulkhead_{bulkhead.name}")(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bulkhead.release()
+
+class DeadlineMiddleware:
+    # Sets the request deadline that bounds every Turso and Gemini call made while handling it
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        seconds = deadline_for(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if seconds is None:
+            await self.app(scope, receive, send)
+            return
+        token = request_deadline.set(time.monotonic() + seconds)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_deadline.reset(token)
+
+# Compressed transport
+# Responses are compressed with brotli (when installed) or gzip if the client
+# accepts it and the body is JSON or text of at least COMPRESSION_MIN_BYTES;
+# streamed bodies are compressed chunk by chunk. Ingest endpoints accept gzip
+# or br request bodies, decompressed with hard limits on both the compressed
+# and the decompressed size so a small upload cannot expand into gigabytes.
+COMPRESSION_ENABLED = env_flag("COMPRESSION_ENABLED", "true")
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+MAX_COMPRESSED_UPLOAD_BYTES = int(os.getenv("MAX_COMPRESSED_UPLOAD_BYTES", str(1024 * 1024)))
+MAX_DECOMPRESSED_UPLOAD_BYTES = int(os.getenv("MAX_DECOMPRESSED_UPLOAD_BYTES", str(8 * 1024 * 1024)))
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+COMPRESSED_UPLOAD_PATHS = ("/health-metrics/", "/health-metrics/batch", "/health-metrics/binary")
+# Older brotli releases cannot cap decompressed output, so br uploads need 1.2+
+BROTLI_UPLOADS = brotli is not None and hasattr(brotli.Decompressor(), "can_accept_more_data")
+
+class UploadTooLarge(Exception):
+    pass
+
+def header_value(scope, name):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+def negotiate_encoding(accept_encoding):
+    # Picks br or gzip from an Accept-Encoding header, honouring q-values
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for encoding in (("br",) if brotli is not None else ()) + ("gzip",):
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+class GzipStream:
+    def __init__(self):
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data, final):
+        # Sync-flush after every chunk so streamed rows reach the client as they are produced
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class BrotliStream:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data, final):
+        return self.compressor.process(data) + (self.compressor.finish() if final else self.compressor.flush())
+
+def decompress_upload(data, encoding):
+    limit = MAX_DECOMPRESSED_UPLOAD_BYTES
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(47)  # gzip or zlib framing
+        body = decompressor.decompress(data, limit + 1)
+        if len(body) > limit:
+            raise UploadTooLarge()
+        if not decompressor.eof:
+            raise ValueError("truncated gzip body")
+        return body
+    
+    decompressor = brotli.Decompressor()
+    chunks = [decompressor.process(data, output_buffer_limit=limit + 1)]
+    size = len(chunks[0])
+    while size <= limit and not decompressor.can_accept_more_data():
+        chunk = decompressor.process(b"", output_buffer_limit=limit + 1 - size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    if size > limit:
+        raise UploadTooLarge()
+    if not decompressor.is_finished():
+        raise ValueError("truncated brotli body")
+    return b"".join(chunks)
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        encoding = negotiate_encoding(header_value(scope, b"accept-encoding")) if scope["type"] == "http" and scope["method"] != "HEAD" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start = None
+        compressor = None
+        
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            
+            if start is not None:
+                # The first body chunk decides: compress, or pass the response through untouched
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                body = message.get("body", b"")
+                more_body = message.get("more_body", False)
+                compressible = (
+                    200 <= start["status"] < 300 and start["status"] != 204
+                    and "content-encoding" not in headers
+                    and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                )
+                if compressible:
+                    headers.add_vary_header("Accept-Encoding")
+                    if more_body or len(body) >= COMPRESSION_MIN_BYTES:
+                        compressor = BrotliStream() if encoding == "br" else GzipStream()
+                        del headers["content-length"]
+                        headers["content-encoding"] = encoding
+                        message = {**message, "body": compressor.compress(body, not more_body)}
+                await send({**start, "headers": headers.raw})
+                start = None
+            elif compressor is not None:
+                message = {**message, "body": compressor.compress(message.get("body", b""), not message.get("more_body", False))}
+            await send(message)
+        
+        await self.app(scope, receive, send_compressed)
+
+class RequestDecompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        encoding = header_value(scope, b"content-encoding") if scope["type"] == "http" and scope["method"] == "POST" else None
+        encoding = (encoding or "").strip().lower()
+        if encoding in ("", "identity") or scope["path"] not in COMPRESSED_UPLOAD_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        supported = ("gzip", "br") if BROTLI_UPLOADS else ("gzip",)
+        if encoding not in supported:
+            response = JSONResponse(
+                {"success": False, "error": f"Unsupported Content-Encoding: {encoding}"},
+                status_code=415,
+                headers={"Accept-Encoding": ", ".join(supported)}
+            )
+            await response(scope, receive, send)
+            return
+        
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_COMPRESSED_UPLOAD_BYTES:
+                await JSONResponse({"success": False, "error": "Request body too large"}, status_code=413)(scope, receive, send)
+                return
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+        
+        try:
+            body = decompress_upload(b"".join(chunks), encoding)
+        except UploadTooLarge:
+            await JSONResponse({"success": False, "error": "Decompressed request body too large"}, status_code=413)(scope, receive, send)
+            return
+        except Exception:
+            await JSONResponse({"success": False, "error": f"Invalid {encoding} request body"}, status_code=400)(scope, receive, send)
+            return
+        
+        headers = [(key, value) for key, value in scope["headers"] if key not in (b"content-encoding", b"content-length")]
+        headers.append((b"content-length", str(len(body)).encode()))
+        replayed = False
+        
+        async def receive_decompressed():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+        
+        await self.app({**scope, "headers": headers}, receive_decompressed, send)
+
+app.add_middleware(RequestDecompressionMiddleware)
+app.add_middleware(DeadlineMiddleware)
+
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+if QUERY_TRACE_ENABLED:
+    app.add_middleware(QueryTraceMiddleware)
+
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -56,6 +992,169 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class FastJSONResponse(JSONResponse):
+    # Rendered with orjson when installed. Handlers return it directly with
+    # already-shaped rows so FastAPI skips jsonable_encoder on large payloads.
+    def render(self, content):
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return super().render(content)
+
+# Conditional GET
+# Listing and status endpoints send an ETag and Last-Modified derived from a
+# cheap version probe (max id / latest row) instead of the payload, and answer
+# a matching If-None-Match or If-Modified-Since with 304 before running the
+# full query. Where the payload is a single row, the probe is the payload query
+# itself and a 200 is built from the probe rows. Probe results are kept in
+# memory for VALIDATOR_TTL_SECONDS and dropped as soon as this instance writes
+# to the resource, so only writes made by other instances can go unnoticed, and
+# for at most that long.
+VALIDATOR_TTL_SECONDS = float(os.getenv("VALIDATOR_TTL_SECONDS", "5"))
+MAX_VALIDATORS = 10000
+
+resource_validators = OrderedDict()
+resource_validators_lock = threading.Lock()
+
+def resource_validator(key, sql, params=None, derive=None):
+    # Returns (etag, last_modified, probe rows) for a resource. `derive` adds state that
+    # changes without a write, computed from the probe rows on every check.
+    now = time.monotonic()
+    with resource_validators_lock:
+        entry = resource_validators.get(key)
+        fresh = entry is not None and now - entry["checked_at"] < VALIDATOR_TTL_SECONDS
+        rows = entry["rows"] if fresh else None
+    if not fresh:
+        rows = turso_rows(execute_turso_sql(sql, params))
+    tag = hashlib.sha1(json.dumps([rows, derive(rows) if derive else None], default=str).encode()).hexdigest()[:20]
+    
+    with resource_validators_lock:
+        entry = resource_validators.pop(key, None)
+        if entry is None or entry["tag"] != tag:
+            # Last-Modified has one-second resolution, so every change moves it forward
+            modified = math.floor(time.time())
+            if entry is not None:
+                modified = max(modified, entry["last_modified"] + 1)
+            entry = {"tag": tag, "last_modified": modified, "rows": rows, "checked_at": now}
+        elif not fresh:
+            entry["rows"] = rows
+            entry["checked_at"] = now
+        resource_validators[key] = entry
+        while len(resource_validators) > MAX_VALIDATORS:
+            resource_validators.popitem(last=False)
+    return f'W/"{tag}"', entry["last_modified"], rows
+
+def invalidate_resource(*keys):
+    with resource_validators_lock:
+        for key in keys:
+            entry = resource_validators.get(key)
+            if entry is not None:
+                entry["checked_at"] = float("-inf")
+
+def invalidate_resource_prefix(prefix):
+    with resource_validators_lock:
+        for key, entry in resource_validators.items():
+            if isinstance(key, tuple) and key[0] == prefix:
+                entry["checked_at"] = float("-inf")
+
+def is_not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, and If-Modified-Since is ignored when If-None-Match is sent
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def conditional_get(request, key, sql, params=None, derive=None):
+    # Returns (validator headers for the 200, 304 response or None, probe rows)
+    etag, last_modified, rows = resource_validator(key, sql, params, derive)
+    headers = {"ETag": etag, "Last-Modified": formatdate(last_modified, usegmt=True), "Cache-Control": "no-cache"}
+    if is_not_modified(request, etag, last_modified):
+        return headers, Response(status_code=304, headers=headers), rows
+    return headers, None, rows
+
+# Device registry
+# Ingest needs each band's owner for health_metrics.user_id, and the devices
+# table changes rarely, so device_id -> user_id is kept in memory: an LRU of at
+# most DEVICE_REGISTRY_SIZE bands, filled the first time a band is seen and by
+# create_device. Unknown bands are registered to DEFAULT_DEVICE_OWNER and
+# looked up in the same round trip. The API never changes the owner of a
+# registered band, so the only invalidation is expiry: entries are trusted for
+# DEVICE_REGISTRY_TTL_SECONDS, after which owners changed directly in the
+# database are picked up.
+DEVICE_REGISTRY_SIZE = int(os.getenv("DEVICE_REGISTRY_SIZE", "50000"))
+DEVICE_REGISTRY_TTL_SECONDS = float(os.getenv("DEVICE_REGISTRY_TTL_SECONDS", "300"))
+DEFAULT_DEVICE_OWNER = 1
+DEVICE_LOOKUP_CHUNK = 500
+
+device_registry = OrderedDict()
+device_registry_lock = threading.Lock()
+
+def remember_device(device_id, user_id):
+    with device_registry_lock:
+        device_registry.pop(device_id, None)
+        device_registry[device_id] = (user_id, time.monotonic())
+        while len(device_registry) > DEVICE_REGISTRY_SIZE:
+            device_registry.popitem(last=False)
+
+def cached_device_owner(device_id):
+    with device_registry_lock:
+        entry = device_registry.get(device_id)
+        if entry is None or time.monotonic() - entry[1] >= DEVICE_REGISTRY_TTL_SECONDS:
+            return None
+        device_registry.move_to_end(device_id)
+        return entry[0]
+
+def resolve_device_owners(device_ids):
+    # Returns {device_id: user_id}, registering bands the devices table doesn't have yet
+    owners = {}
+    missing = []
+    for device_id in dict.fromkeys(device_ids):
+        owner = cached_device_owner(device_id)
+        if owner is None:
+            missing.append(device_id)
+        else:
+            owners[device_id] = owner
+    if METRICS_ENABLED:
+        if owners:
+            inc_metric("device_registry_lookups_total", (("result", "hit"),), len(owners))
+        if missing:
+            inc_metric("device_registry_lookups_total", (("result", "miss"),), len(missing))
+    if not missing:
+        return owners
+
+    statements = [
+        ("INSERT OR IGNORE INTO devices (device_id, user_id, model, status) VALUES (?, ?, ?, ?)", [device_id, DEFAULT_DEVICE_OWNER, "BioBand Pro", "active"])
+        for device_id in missing
+    ]
+    lookups = [missing[start:start + DEVICE_LOOKUP_CHUNK] for start in range(0, len(missing), DEVICE_LOOKUP_CHUNK)]
+    for chunk in lookups:
+        statements.append(("SELECT device_id, user_id FROM devices WHERE device_id IN (" + ", ".join(["?"] * len(chunk)) + ")", chunk))
+
+    # INSERT OR IGNORE makes the whole pipeline safe to retry
+    items = execute_turso_pipeline(statements, idempotent=True).get("results", [])
+    failed = [item for item in items if item.get("type") != "ok"]
+    if failed or len(items) != len(statements):
+        message = failed[0].get("error", {}).get("message") if failed else "incomplete pipeline response"
+        raise DatabaseError(f"Device lookup failed: {message}", "sql")
+
+    if any(item["response"]["result"].get("affected_row_count") for item in items[:len(missing)]):
+        invalidate_resource("devices")
+    for item in items[len(missing):]:
+        for row in turso_rows({"results": [item]}):
+            device_id, user_id = row
+            owners[device_id] = user_id
+            remember_device(device_id, user_id)
+    for device_id in missing:
+        # Only if the row was deleted between the INSERT and the SELECT; not cached
+        owners.setdefault(device_id, DEFAULT_DEVICE_OWNER)
+    return owners
+
 class HealthMetricCreate(BaseModel):
     device_id: str
     timestamp: str
@@ -76,6 +1175,9 @@ class DeviceCreate(BaseModel):
     model: str = "BioBand Pro"
     status: str = "active"
 
+class HealthMetricBatch(BaseModel):
+    readings: List[HealthMetricCreate]
+
 class MessageRequest(BaseModel):
     message: str
     session_id: str = "default"
@@ -96,8 +1198,13 @@ def root():
             "POST /devices/": "Create new device",
             "GET /health-metrics/": "Get all health data",
             "GET /health-metrics/device/{device_id}": "Get health data by device",
+            "GET /export/health-metrics": "Stream health data as CSV, Parquet or Arrow",
+            "GET /fleet/stats": "Fleet-wide quantiles, SpO2 share and active devices",
             "POST /health-metrics/": "Add health data (with validation)",
+            "POST /health-metrics/batch": "Add up to 500 readings in one request (gzip/br bodies accepted)",
+            "POST /health-metrics/binary": "Add readings as compact binary frames",
             "GET /health-status/{device_id}": "Get health status analysis",
+            "GET /activity-sessions/{device_id}": "Activity, rest and sleep sessions in a time range",
             "GET /dashboard/{user_id}": "Get user dashboard with all devices",
             "GET /reports/recent/{hours}": "Get recent data report (default 24 hours)",
             "GET /reports/device/{device_id}/recent": "Get recent data report for specific device",
@@ -108,13 +1215,21 @@ def root():
             "GET /data-validation/health-metrics": "Validate existing health data",
             "POST /data-cleanup/invalid-records": "Remove invalid health records",
             "POST /chat": "AI Health Assistant",
-            "GET /chat/{session_id}": "Get chat history"
+            "GET /chat/{session_id}": "Get chat history",
+            "GET /metrics": "Prometheus metrics (latency, errors, DB queries)",
+            "GET /debug/traces": "Recent request query traces (DEBUG_TRACE_ENABLED)",
+            "GET /debug/traces/{request_id}": "SQL trace for one request (DEBUG_TRACE_ENABLED)"
         }
     }
 
-@app.get("/users/")
-def get_all_users():
+@app.get("/users/", response_class=FastJSONResponse)
+def get_all_users(request: Request):
     try:
+        # Users are only ever inserted through the API, so the newest id versions the list
+        headers, not_modified, _ = conditional_get(request, "users", "SELECT MAX(id) FROM users")
+        if not_modified:
+            return not_modified
+        
         result = execute_turso_sql("SELECT id, full_name, email, created_at FROM users ORDER BY id")
         
         users_data = []
@@ -128,7 +1243,7 @@ def get_all_users():
                     "created_at": row[3]["value"] if isinstance(row[3], dict) and "value" in row[3] else str(row[3])
                 })
         
-        return {"success": True, "users": users_data, "count": len(users_data)}
+        return FastJSONResponse({"success": True, "users": users_data, "count": len(users_data)}, headers=headers)
         
     except Exception as e:
         return {"success": False, "error": str(e), "users": [], "count": 0}
@@ -161,6 +1276,7 @@ def create_user(user: UserCreate):
         result = execute_turso_sql("INSERT INTO users (full_name, email) VALUES (?, ?)", [user.full_name, user.email])
         
         if result and result.get("results") and result["results"][0].get("type") == "ok":
+            invalidate_resource("users")
             return {"success": True, "message": "User created successfully"}
         else:
             return {"success": False, "message": "Failed to create user", "debug": result}
@@ -168,9 +1284,14 @@ def create_user(user: UserCreate):
     except Exception as e:
         return {"success": False, "message": f"Error: {str(e)}"}
 
-@app.get("/devices/")
-def get_all_devices():
+@app.get("/devices/", response_class=FastJSONResponse)
+def get_all_devices(request: Request):
     try:
+        # Like users, devices are only ever inserted
+        headers, not_modified, _ = conditional_get(request, "devices", "SELECT MAX(id) FROM devices")
+        if not_modified:
+            return not_modified
+        
         result = execute_turso_sql("SELECT id, device_id, user_id, model, status FROM devices ORDER BY id")
         
         devices_data = []
@@ -185,7 +1306,7 @@ def get_all_devices():
                     "status": row[4]["value"] if isinstance(row[4], dict) and "value" in row[4] else str(row[4])
                 })
         
-        return {"success": True, "devices": devices_data, "count": len(devices_data)}
+        return FastJSONResponse({"success": True, "devices": devices_data, "count": len(devices_data)}, headers=headers)
         
     except Exception as e:
         return {"success": False, "error": str(e), "devices": [], "count": 0}
@@ -199,6 +1320,8 @@ def create_device(device: DeviceCreate):
         )
         
         if result and result.get("results") and result["results"][0].get("type") == "ok":
+            invalidate_resource("devices")
+            remember_device(device.device_id, device.user_id)
             return {
                 "success": True,
                 "message": "Device created successfully",
@@ -215,9 +1338,15 @@ def create_device(device: DeviceCreate):
     except Exception as e:
         return {"success": False, "message": f"Error: {str(e)}"}
 
-@app.get("/health-metrics/")
-def get_all_health_metrics():
+@app.get("/health-metrics/", response_class=FastJSONResponse)
+def get_all_health_metrics(request: Request):
     try:
+        # The listing is the newest 50 rows by id. Their ids version it, so a
+        # cleanup that deletes some of them changes the tag even though MAX(id) doesn't.
+        headers, not_modified, _ = conditional_get(request, "health-metrics", "SELECT id FROM health_metrics ORDER BY id DESC LIMIT 50")
+        if not_modified:
+            return not_modified
+        
         result = execute_turso_sql("SELECT id, device_id, heart_rate, spo2, temperature, steps, calories, activity, timestamp FROM health_metrics ORDER BY id DESC LIMIT 50")
         
         health_data = []
@@ -236,12 +1365,12 @@ def get_all_health_metrics():
                     "timestamp": row[8]["value"] if isinstance(row[8], dict) and "value" in row[8] else row[8]
                 })
         
-        return {"success": True, "health_metrics": health_data, "count": len(health_data)}
+        return FastJSONResponse({"success": True, "health_metrics": health_data, "count": len(health_data)}, headers=headers)
         
     except Exception as e:
         return {"success": False, "error": str(e), "health_metrics": [], "count": 0}
 
-@app.get("/health-metrics/device/{device_id}")
+@app.get("/health-metrics/device/{device_id}", response_class=FastJSONResponse)
 def get_health_metrics_by_device(device_id: str):
     try:
         result = execute_turso_sql("SELECT id, device_id, heart_rate, spo2, temperature, steps, calories, activity, timestamp FROM health_metrics WHERE device_id = ? ORDER BY timestamp DESC", [device_id])
@@ -262,53 +1391,57 @@ def get_health_metrics_by_device(device_id: str):
                     "timestamp": row[8]["value"] if isinstance(row[8], dict) and "value" in row[8] else row[8]
                 })
         
-        return {"success": True, "device_id": device_id, "health_metrics": health_data, "count": len(health_data)}
+        return FastJSONResponse({"success": True, "device_id": device_id, "health_metrics": health_data, "count": len(health_data)})
         
     except Exception as e:
         return {"success": False, "error": str(e), "device_id": device_id, "health_metrics": [], "count": 0}
 
+def validate_health_metric(data):
+    validation_errors = []
+    
+    if data.heart_rate is not None and (data.heart_rate < 30 or data.heart_rate > 220):
+        validation_errors.append(f"Invalid heart rate: {data.heart_rate} (valid range: 30-220 BPM)")
+    
+    if data.spo2 is not None and (data.spo2 < 70 or data.spo2 > 100):
+        validation_errors.append(f"Invalid SpO2: {data.spo2} (valid range: 70-100%)")
+    
+    if data.temperature is not None and (data.temperature < 30.0 or data.temperature > 45.0):
+        validation_errors.append(f"Invalid temperature: {data.temperature} (valid range: 30-45°C)")
+    
+    if data.steps is not None and (data.steps < 0 or data.steps > 100000):
+        validation_errors.append(f"Invalid steps: {data.steps} (valid range: 0-100000)")
+    
+    if data.calories is not None and (data.calories < 0 or data.calories > 10000):
+        validation_errors.append(f"Invalid calories: {data.calories} (valid range: 0-10000)")
+    
+    return validation_errors
+
 @app.post("/health-metrics/")
 def add_health_metric(data: HealthMetricCreate):
+    rejected = check_device_rate(data.device_id)
+    if rejected:
+        return rejected
+    
     try:
         # Validate health metrics
-        validation_errors = []
-        
-        if data.heart_rate is not None and (data.heart_rate < 30 or data.heart_rate > 220):
-            validation_errors.append(f"Invalid heart rate: {data.heart_rate} (valid range: 30-220 BPM)")
-        
-        if data.spo2 is not None and (data.spo2 < 70 or data.spo2 > 100):
-            validation_errors.append(f"Invalid SpO2: {data.spo2} (valid range: 70-100%)")
-        
-        if data.temperature is not None and (data.temperature < 30.0 or data.temperature > 45.0):
-            validation_errors.append(f"Invalid temperature: {data.temperature} (valid range: 30-45°C)")
-        
-        if data.steps is not None and (data.steps < 0 or data.steps > 100000):
-            validation_errors.append(f"Invalid steps: {data.steps} (valid range: 0-100000)")
-        
-        if data.calories is not None and (data.calories < 0 or data.calories > 10000):
-            validation_errors.append(f"Invalid calories: {data.calories} (valid range: 0-10000)")
-        
+        validation_errors = validate_health_metric(data)
         if validation_errors:
             return {"success": False, "message": "Validation failed", "errors": validation_errors}
         
-        # First, ensure the device exists or create it
-        device_check = execute_turso_sql("SELECT id FROM devices WHERE device_id = ?", [data.device_id])
-        
-        if not (device_check and device_check.get("results") and device_check["results"][0].get("response", {}).get("result", {}).get("rows")):
-            # Device doesn't exist, create it
-            execute_turso_sql(
-                "INSERT OR IGNORE INTO devices (device_id, user_id, model, status) VALUES (?, ?, ?, ?)",
-                [data.device_id, 1, "BioBand Pro", "active"]
-            )
+        # Owner from the device registry; unknown bands are registered on the way
+        user_id = resolve_device_owners([data.device_id])[data.device_id]
         
         # Insert health metric without foreign key constraints
         result = execute_turso_sql(
             "INSERT INTO health_metrics (device_id, user_id, heart_rate, spo2, temperature, steps, calories, activity, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            [data.device_id, 1, data.heart_rate, data.spo2, data.temperature, data.steps, data.calories, data.activity, data.timestamp]
+            [data.device_id, user_id, data.heart_rate, data.spo2, data.temperature, data.steps, data.calories, data.activity, data.timestamp]
         )
         
         # Check if insert was successful
         if result and result.get("results") and result["results"][0].get("type") == "ok":
+            invalidate_resource("health-metrics", ("health-status", data.device_id))
+            record_activity([data])
+            
             # Get the inserted record to confirm
             get_result = execute_turso_sql(
                 "SELECT id, device_id, heart_rate, spo2, temperature, steps, calories, activity, timestamp FROM health_metrics WHERE device_id = ? ORDER BY id DESC LIMIT 1",
@@ -339,6 +1472,208 @@ def add_health_metric(data: HealthMetricCreate):
     except Exception as e:
         return {"success": False, "message": f"Error: {str(e)}"}
 
+# Batch ingest
+# Bands that buffer readings upload them together (optionally gzip/br
+# compressed). Each reading goes through validate_health_metric; the valid
+# ones are written with multi-row INSERTs in one transaction and round trip,
+# plus one for bands the device registry hasn't seen yet.
+MAX_BATCH_READINGS = int(os.getenv("MAX_BATCH_READINGS", "500"))
+# Batches draw on their own per-band bucket, in readings per second. Its burst
+# holds at least one full batch so a band can upload what it buffered offline,
+# and every reading is charged.
+device_batch_rate_limits = TokenBuckets(
+    float(os.getenv("DEVICE_BATCH_RATE_PER_SEC", "2")),
+    max(float(os.getenv("DEVICE_BATCH_BURST", "0")), MAX_BATCH_READINGS)
+)
+INSERT_CHUNK_ROWS = 100  # 9 parameters per row stays under SQLite's 999-variable limit
+
+def store_health_metrics(readings):
+    device_ids = list(dict.fromkeys(reading.device_id for reading in readings))
+    owners = resolve_device_owners(device_ids)
+    statements = []
+    for start in range(0, len(readings), INSERT_CHUNK_ROWS):
+        chunk = readings[start:start + INSERT_CHUNK_ROWS]
+        params = []
+        for reading in chunk:
+            params.extend([reading.device_id, owners[reading.device_id], reading.heart_rate, reading.spo2, reading.temperature, reading.steps, reading.calories, reading.activity, reading.timestamp])
+        statements.append((
+            "INSERT INTO health_metrics (device_id, user_id, heart_rate, spo2, temperature, steps, calories, activity, timestamp) VALUES "
+            + ", ".join(["(?, ?, ?, ?, ?, ?, ?, ?, ?)"] * len(chunk)),
+            params
+        ))
+    
+    # All chunks commit together, so a failed batch leaves nothing behind for the band's retry to duplicate
+    try:
+        execute_turso_transaction(statements)
+    except DatabaseError as e:
+        raise DatabaseError(f"Batch insert failed: {e}", e.kind)
+    
+    invalidate_resource("health-metrics", *[("health-status", device_id) for device_id in device_ids])
+    record_activity(readings)
+
+def ingest_readings(readings, validated=False):
+    # Shared by the JSON batch and binary frame routes: rate limit, validate, store.
+    # `validated` skips the per-reading checks when the caller already ran them in bulk.
+    if not readings:
+        return {"success": False, "message": "No readings in batch"}
+    if len(readings) > MAX_BATCH_READINGS:
+        return {"success": False, "message": f"Too many readings: {len(readings)} (max {MAX_BATCH_READINGS})"}
+    
+    per_device = {}
+    for reading in readings:
+        per_device[reading.device_id] = per_device.get(reading.device_id, 0) + 1
+    for device_id, count in per_device.items():
+        rejected = check_device_rate(device_id, count, device_batch_rate_limits, "device_batch_rate")
+        if rejected:
+            return rejected
+    
+    try:
+        accepted = []
+        rejected_readings = []
+        for index, reading in enumerate(readings):
+            validation_errors = [] if validated else validate_health_metric(reading)
+            if validation_errors:
+                rejected_readings.append({"index": index, "device_id": reading.device_id, "errors": validation_errors})
+            else:
+                accepted.append(reading)
+        
+        if not accepted:
+            return {"success": False, "message": "Validation failed", "accepted": 0, "rejected": rejected_readings}
+        
+        store_health_metrics(accepted)
+        return {
+            "success": True,
+            "message": f"{len(accepted)} health metrics recorded successfully",
+            "accepted": len(accepted),
+            "rejected": rejected_readings
+        }
+        
+    except Exception as e:
+        return {"success": False, "message": f"Error: {str(e)}"}
+
+@app.post("/health-metrics/batch")
+def add_health_metrics_batch(batch: HealthMetricBatch):
+    return ingest_readings(batch.readings)
+
+# Binary frames
+# A compact alternative to JSON for bands: one frame per band, several frames
+# may be concatenated in one body. Little-endian layout:
+#   "BB", version (u8), device id length (u8), device id (ASCII),
+#   reading count (u16), base time (u32 epoch seconds), UTC offset (i16 minutes),
+#   then one column per field, `count` values each:
+#   time offset from base (u16 s), heart rate (u8, 0 = none), SpO2 (u8, 0 = none),
+#   temperature (u16 in 0.01 °C, 0 = none), steps (u32, 0xFFFFFFFF = none),
+#   calories (u16, 0xFFFF = none), activity code (u8, see FRAME_ACTIVITIES)
+# Columns are unpacked with one struct call each and range-checked through
+# validate_health_metric on their minima and maxima; only frames that fail
+# that are checked reading by reading. The readings then take the same write
+# path as POST /health-metrics/batch.
+FRAME_MAGIC = b"BB"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<HIh")
+FRAME_COLUMNS = ("H", "B", "B", "H", "I", "H", "B")
+FRAME_READING_BYTES = sum(struct.calcsize("<" + code) for code in FRAME_COLUMNS)
+# 0 means "not sent" and gets the same default as the JSON model
+FRAME_ACTIVITIES = ("Walking", "Walking", "Running", "Cycling", "Resting", "Swimming", "Sleeping")
+
+FrameReading = namedtuple("FrameReading", "device_id timestamp heart_rate spo2 temperature steps calories activity")
+
+class FrameError(ValueError):
+    pass
+
+CLOCK_MINUTES = [f"T{hour:02d}:{minute:02d}:" for hour in range(24) for minute in range(60)]
+CLOCK_SECONDS = [f"{second:02d}" for second in range(60)]
+
+def frame_timestamps(base_time, utc_offset, offsets):
+    # ISO 8601 strings in the band's offset, assembled from lookup tables; a
+    # datetime per reading would cost more than the rest of the decoding together
+    sign = "-" if utc_offset < 0 else "+"
+    suffix = f"{sign}{abs(utc_offset) // 60:02d}:{abs(utc_offset) % 60:02d}"
+    local_base = base_time + utc_offset * 60
+    dates = {}
+    timestamps = []
+    for time_offset in offsets:
+        day, seconds = divmod(local_base + time_offset, 86400)
+        date = dates.get(day)
+        if date is None:
+            date = dates[day] = (datetime(1970, 1, 1) + timedelta(days=day)).date().isoformat()
+        minute, second = divmod(seconds, 60)
+        timestamps.append(date + CLOCK_MINUTES[minute] + CLOCK_SECONDS[second] + suffix)
+    return timestamps
+
+def present_range(values, missing):
+    present = list(filter(missing.__ne__, values))
+    return (min(present), max(present)) if present else (None, None)
+
+def decode_health_frames(body):
+    # Returns (readings, all_valid). all_valid is True when every frame's column
+    # minima and maxima pass validate_health_metric, so no reading can fail it.
+    readings = []
+    all_valid = True
+    offset = 0
+    while offset < len(body):
+        if body[offset:offset + 2] != FRAME_MAGIC:
+            raise FrameError(f"expected frame start at byte {offset}")
+        if len(body) < offset + 4:
+            raise FrameError("truncated frame header")
+        version, id_length = body[offset + 2], body[offset + 3]
+        if version != FRAME_VERSION:
+            raise FrameError(f"unsupported frame version {version}")
+        if not 1 <= id_length <= 64:
+            raise FrameError(f"invalid device id length {id_length}")
+        try:
+            device_id = body[offset + 4:offset + 4 + id_length].decode("ascii")
+        except UnicodeDecodeError:
+            raise FrameError("device id is not ASCII")
+        offset += 4 + id_length
+        if len(body) < offset + FRAME_HEADER.size:
+            raise FrameError("truncated frame header")
+        count, base_time, utc_offset = FRAME_HEADER.unpack_from(body, offset)
+        offset += FRAME_HEADER.size
+        if len(body) < offset + count * FRAME_READING_BYTES:
+            raise FrameError(f"frame for {device_id} is shorter than its {count} readings")
+        if len(readings) + count > MAX_BATCH_READINGS:
+            raise FrameError(f"more than {MAX_BATCH_READINGS} readings")
+        if not -1440 < utc_offset < 1440:
+            raise FrameError(f"invalid UTC offset {utc_offset}")
+        if count == 0:
+            continue
+        
+        columns = []
+        for code in FRAME_COLUMNS:
+            columns.append(struct.unpack_from(f"<{count}{code}", body, offset))
+            offset += count * struct.calcsize("<" + code)
+        time_offsets, heart_rates, spo2s, temperatures, steps, calories, activities = columns
+        if max(activities) >= len(FRAME_ACTIVITIES):
+            raise FrameError(f"unknown activity code {max(activities)}")
+        
+        ranges = [present_range(heart_rates, 0), present_range(spo2s, 0), present_range(temperatures, 0), present_range(steps, 0xFFFFFFFF), present_range(calories, 0xFFFF)]
+        for bound in (0, 1):
+            heart_rate, spo2, temperature, step_count, calorie_count = (r[bound] for r in ranges)
+            extreme = FrameReading(device_id, "", heart_rate, spo2, temperature / 100 if temperature else None, step_count, calorie_count, None)
+            if validate_health_metric(extreme):
+                all_valid = False
+        
+        readings.extend(map(FrameReading._make, zip(
+            [device_id] * count,
+            frame_timestamps(base_time, utc_offset, time_offsets),
+            [value or None for value in heart_rates],
+            [value or None for value in spo2s],
+            [value / 100 if value else None for value in temperatures],
+            [None if value == 0xFFFFFFFF else value for value in steps],
+            [None if value == 0xFFFF else value for value in calories],
+            [FRAME_ACTIVITIES[value] for value in activities]
+        )))
+    return readings, all_valid
+
+@app.post("/health-metrics/binary")
+async def add_health_metrics_binary(request: Request):
+    try:
+        readings, all_valid = decode_health_frames(await request.body())
+    except FrameError as e:
+        return {"success": False, "message": f"Invalid frame: {e}"}
+    return await run_in_threadpool(ingest_readings, readings, all_valid)
+
 @app.post("/chat")
 async def chat(request: MessageRequest):
     if not GEMINI_API_KEY:
@@ -351,14 +1686,14 @@ async def chat(request: MessageRequest):
     sessions[request.session_id].append({"role": "user", "message": request.message, "timestamp": timestamp})
     
     try:
-        response = requests.post(
-            "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent",
+        response = get_http_session().post(
+            GEMINI_API_URL,
             headers={"Content-Type": "application/json", "X-goog-api-key": GEMINI_API_KEY},
             json={
                 "contents": [{"parts": [{"text": f"You are Bio Band AI Assistant. Only answer health questions in simple English. If not health-related, say 'I only help with health questions.' Question: {request.message}"}]}],
                 "generationConfig": {"maxOutputTokens": 150}
             },
-            timeout=30
+            timeout=deadline_timeout(30)
         )
         
         if response.status_code == 200:
@@ -377,16 +1712,30 @@ async def get_chat_history(session_id: str):
         return {"success": True, "session_id": session_id, "history": sessions[session_id], "message_count": len(sessions[session_id])}
     return {"success": True, "session_id": session_id, "history": [], "message_count": 0}
 
-@app.get("/health-status/{device_id}")
-def get_health_status(device_id: str):
+def connection_status_for(timestamp):
+    # "connected" while the latest reading is under five minutes old
     try:
-        # Get latest health metrics for the device
-        result = execute_turso_sql(
-            "SELECT heart_rate, spo2, temperature, steps, calories, activity, timestamp FROM health_metrics WHERE device_id = ? ORDER BY timestamp DESC LIMIT 1",
-            [device_id]
+        last_update = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        time_diff = datetime.now().replace(tzinfo=last_update.tzinfo) - last_update
+        return "connected" if time_diff < timedelta(minutes=5) else "disconnected"
+    except:
+        return "unknown"
+
+@app.get("/health-status/{device_id}", response_class=FastJSONResponse)
+def get_health_status(device_id: str, request: Request):
+    try:
+        # The latest reading is both the version probe and the payload: one query per 200
+        headers, not_modified, rows = conditional_get(
+            request,
+            ("health-status", device_id),
+            "SELECT id, heart_rate, spo2, temperature, steps, calories, activity, timestamp FROM health_metrics WHERE device_id = ? ORDER BY timestamp DESC LIMIT 1",
+            [device_id],
+            derive=lambda rows: connection_status_for(rows[0][7]) if rows else None
         )
+        if not_modified:
+            return not_modified
         
-        if not (result.get("results") and result["results"][0].get("response", {}).get("result", {}).get("rows")):
+        if not rows:
             return {
                 "success": False,
                 "device_id": device_id,
@@ -394,16 +1743,7 @@ def get_health_status(device_id: str):
                 "connection_status": "disconnected"
             }
         
-        row = result["results"][0]["response"]["result"]["rows"][0]
-        
-        # Extract values
-        heart_rate = int(row[0]["value"]) if isinstance(row[0], dict) and row[0]["value"] else row[0]
-        spo2 = int(row[1]["value"]) if isinstance(row[1], dict) and row[1]["value"] else row[1]
-        temperature = float(row[2]["value"]) if isinstance(row[2], dict) and row[2]["value"] else row[2]
-        steps = int(row[3]["value"]) if isinstance(row[3], dict) and row[3]["value"] else row[3]
-        calories = int(row[4]["value"]) if isinstance(row[4], dict) and row[4]["value"] else row[4]
-        activity = row[5]["value"] if isinstance(row[5], dict) else row[5]
-        timestamp = row[6]["value"] if isinstance(row[6], dict) else row[6]
+        _, heart_rate, spo2, temperature, steps, calories, activity, timestamp = rows[0]
         
         # Analyze health status
         health_status = "Good"
@@ -434,15 +1774,9 @@ def get_health_status(device_id: str):
                 alerts.append("Body temperature is below normal")
         
         # Connection status (if data is recent)
-        from datetime import datetime, timedelta
-        try:
-            last_update = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-            time_diff = datetime.now().replace(tzinfo=last_update.tzinfo) - last_update
-            connection_status = "connected" if time_diff < timedelta(minutes=5) else "disconnected"
-        except:
-            connection_status = "unknown"
+        connection_status = connection_status_for(timestamp)
         
-        return {
+        return FastJSONResponse({
             "success": True,
             "device_id": device_id,
             "connection_status": connection_status,
@@ -462,7 +1796,7 @@ def get_health_status(device_id: str):
                 "spo2": "Normal: 95-100%",
                 "temperature": "Normal: 36-37°C"
             }
-        }
+        }, headers=headers)
         
     except Exception as e:
         return {
@@ -473,20 +1807,32 @@ def get_health_status(device_id: str):
         }
 
 @app.get("/dashboard/{user_id}")
-def get_user_dashboard(user_id: int):
+def get_user_dashboard(user_id: int, day: Optional[str] = None):
     try:
+        day = day or utc_now().date().isoformat()
+        
         # Get user's devices
         devices_result = execute_turso_sql(
             "SELECT device_id, model, status FROM devices WHERE user_id = ?",
             [user_id]
         )
         
+        # Today's totals come from the incrementally maintained daily_activity table
+        activity_today = {
+            row[0]: {"steps": row[1], "calories": row[2]}
+            for row in turso_rows(execute_turso_sql(
+                "SELECT device_id, steps, calories FROM daily_activity WHERE day = ? AND device_id IN (SELECT device_id FROM devices WHERE user_id = ?)",
+                [day, user_id]
+            ))
+        }
+        
         dashboard_data = {
             "user_id": user_id,
+            "day": day,
             "devices": [],
             "overall_status": "Good",
-            "total_steps_today": 0,
-            "total_calories_today": 0
+            "total_steps_today": sum(totals["steps"] for totals in activity_today.values()),
+            "total_calories_today": sum(totals["calories"] for totals in activity_today.values())
         }
         
         if devices_result.get("results") and devices_result["results"][0].get("response", {}).get("result", {}).get("rows"):
@@ -508,6 +1854,7 @@ def get_user_dashboard(user_id: int):
                     "model": model,
                     "status": status,
                     "connection_status": "disconnected",
+                    "today": activity_today.get(device_id, {"steps": 0, "calories": 0}),
                     "latest_metrics": None
                 }
                 
@@ -517,9 +1864,6 @@ def get_user_dashboard(user_id: int):
                     steps = int(metric_row[3]["value"]) if isinstance(metric_row[3], dict) and metric_row[3]["value"] else metric_row[3] or 0
                     calories = int(metric_row[4]["value"]) if isinstance(metric_row[4], dict) and metric_row[4]["value"] else metric_row[4] or 0
                     
-                    dashboard_data["total_steps_today"] += steps
-                    dashboard_data["total_calories_today"] += calories
-                    
                     device_data["latest_metrics"] = {
                         "heart_rate": int(metric_row[0]["value"]) if isinstance(metric_row[0], dict) and metric_row[0]["value"] else metric_row[0],
                         "spo2": int(metric_row[1]["value"]) if isinstance(metric_row[1], dict) and metric_row[1]["value"] else metric_row[1],
@@ -538,8 +1882,11 @@ def get_user_dashboard(user_id: int):
     except Exception as e:
         return {"success": False, "error": str(e), "user_id": user_id}
 
-@app.get("/reports/recent/{hours}")
+@app.get("/reports/recent/{hours}", response_class=FastJSONResponse)
 def get_recent_data_report(hours: int = 24):
+    return report_response(f"recent:{hours}", build_recent_report, hours)
+
+def build_recent_report(hours):
     try:
         from datetime import datetime, timedelta
         
@@ -654,7 +2001,7 @@ def get_recent_data_report(hours: int = 24):
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-@app.get("/reports/device/{device_id}/recent")
+@app.get("/reports/device/{device_id}/recent", response_class=FastJSONResponse)
 def get_device_recent_report(device_id: str, limit: int = 5):
     try:
         # Get recent health metrics for specific device
@@ -737,7 +2084,7 @@ def get_device_recent_report(device_id: str, limit: int = 5):
                 health_status = "Abnormal Temperature"
                 alerts.append(f"Temperature {temp}°C is outside normal range (36-37°C)")
         
-        return {
+        return FastJSONResponse({
             "success": True,
             "device_id": device_id,
             "generated_at": datetime.now().isoformat(),
@@ -751,8 +2098,9 @@ def get_device_recent_report(device_id: str, limit: int = 5):
                 "health_status": health_status,
                 "alerts": alerts
             },
+            "activity_today": get_activity_today(device_id),
             "recent_records": recent_data
-        }
+        })
         
     except Exception as e:
         return {
@@ -851,13 +2199,14 @@ def get_device_report(device_id: str):
                 "spo2": latest_record["spo2"] if latest_record else None,
                 "temperature": latest_record["temperature"] if latest_record else None,
                 "timestamp": latest_record["timestamp"] if latest_record else None
-            }
+            },
+            "activity_today": get_activity_today(device_id)
         }
         
     except Exception as e:
         return {"success": False, "error": str(e), "device_id": device_id}
 
-@app.get("/reports/recently-added/{device_id}")
+@app.get("/reports/recently-added/{device_id}", response_class=FastJSONResponse)
 def get_recently_added_device_data(device_id: str, limit: int = 1):
     try:
         # Get most recent health metrics for specific device
@@ -913,18 +2262,18 @@ def get_recently_added_device_data(device_id: str, limit: int = 1):
                     "issues": issues if issues else ["No health issues detected"]
                 })
         
-        return {
+        return FastJSONResponse({
             "success": True,
             "device_id": device_id,
             "generated_at": datetime.now().isoformat(),
             "count": len(recent_data),
             "recently_added_data": recent_data
-        }
+        })
         
     except Exception as e:
         return {"success": False, "error": str(e), "device_id": device_id}
 
-@app.get("/reports/recently-added/{minutes}")
+@app.get("/reports/recently-added/{minutes}", response_class=FastJSONResponse)
 def get_recently_added_data(minutes: int = 30):
     try:
         from datetime import datetime, timedelta
@@ -955,19 +2304,22 @@ def get_recently_added_data(minutes: int = 30):
                     "timestamp": row[8]["value"] if isinstance(row[8], dict) else row[8]
                 })
         
-        return {
+        return FastJSONResponse({
             "success": True,
             "time_period": f"Last {minutes} minutes",
             "generated_at": datetime.now().isoformat(),
             "count": len(recent_data),
             "recently_added_data": recent_data
-        }
+        })
         
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-@app.get("/reports/latest-entries/{limit}")
+@app.get("/reports/latest-entries/{limit}", response_class=FastJSONResponse)
 def get_latest_entries(limit: int = 10):
+    return report_response(f"latest-entries:{limit}", build_latest_entries, limit)
+
+def build_latest_entries(limit):
     try:
         # Get latest health metrics
         health_result = execute_turso_sql(
@@ -1015,6 +2367,8 @@ def cleanup_invalid_data():
         
         # Delete records with invalid temperature
         execute_turso_sql("DELETE FROM health_metrics WHERE temperature < 30.0 OR temperature > 45.0")
+        invalidate_resource("health-metrics")
+        invalidate_resource_prefix("health-status")
         
         return {"success": True, "message": "Invalid health records removed"}
         
@@ -1023,4 +2377,841 @@ def cleanup_invalid_data():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat(), "database": "Connected" if DATABASE_TOKEN else "Not configured"}
\ No newline at end of file
+    return {"status": "healthy", "timestamp": datetime.now().isoformat(), "database": "Connected" if DATABASE_TOKEN else "Not configured"}
+
+@app.get("/metrics")
+def get_metrics():
+    if not METRICS_ENABLED:
+        return PlainTextResponse("# Metrics disabled (set METRICS_ENABLED=true)\n", status_code=404)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/traces")
+def get_recent_traces(limit: int = 50, min_queries: int = 0):
+    if not DEBUG_TRACE_ENABLED:
+        return {"success": False, "error": "Query trace debugging disabled (set DEBUG_TRACE_ENABLED=true)"}
+    
+    with traces_lock:
+        traces = list(recent_traces.values())
+    traces = [summarize_trace(trace) for trace in reversed(traces) if trace["query_count"] >= min_queries][:limit]
+    return {"success": True, "traces": traces, "count": len(traces)}
+
+@app.get("/debug/traces/{request_id}")
+def get_trace(request_id: str):
+    if not DEBUG_TRACE_ENABLED:
+        return {"success": False, "error": "Query trace debugging disabled (set DEBUG_TRACE_ENABLED=true)"}
+    
+    with traces_lock:
+        trace = recent_traces.get(request_id)
+    if trace is None:
+        return {"success": False, "error": "Trace not found", "request_id": request_id}
+    
+    return {"success": True, "trace": {**summarize_trace(trace), "queries": trace["queries"]}}
+
+# Bulk export
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "5000"))
+EXPORT_COLUMNS = ["id", "device_id", "user_id", "heart_rate", "spo2", "temperature", "steps", "calories", "activity", "timestamp"]
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows")
+}
+
+class ChunkSink:
+    # Write-only file object for pyarrow writers; drain() hands back what was
+    # written since the last call so each row group is yielded and released.
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def export_pages(device_id, user_id, start, end, page_size):
+    # Keyset pagination on id: each page is an index range scan, never an OFFSET
+    conditions = ["id > ?"]
+    filters = []
+    if device_id:
+        conditions.append("device_id = ?")
+        filters.append(device_id)
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        filters.append(user_id)
+    if start:
+        conditions.append("timestamp >= ?")
+        filters.append(start)
+    if end:
+        conditions.append("timestamp < ?")
+        filters.append(end)
+    sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM health_metrics WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+    
+    last_id = 0
+    while True:
+        rows = turso_rows(execute_turso_sql(sql, [last_id] + filters + [page_size]))
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1][0]
+
+def export_arrow_schema(pa):
+    return pa.schema([
+        ("id", pa.int64()),
+        ("device_id", pa.string()),
+        ("user_id", pa.int64()),
+        ("heart_rate", pa.int64()),
+        ("spo2", pa.int64()),
+        ("temperature", pa.float64()),
+        ("steps", pa.int64()),
+        ("calories", pa.int64()),
+        ("activity", pa.string()),
+        ("timestamp", pa.string())
+    ])
+
+def export_arrow_batch(pa, schema, rows):
+    columns = list(zip(*rows))
+    return pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+
+def stream_csv(pages):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in pages:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+def stream_parquet(pages):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    schema = export_arrow_schema(pa)
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for rows in pages:
+            writer.write_batch(export_arrow_batch(pa, schema, rows), row_group_size=len(rows))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def stream_arrow(pages):
+    import pyarrow as pa
+    
+    schema = export_arrow_schema(pa)
+    sink = ChunkSink()
+    writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for rows in pages:
+            writer.write_batch(export_arrow_batch(pa, schema, rows))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+@app.get("/export/health-metrics")
+def export_health_metrics(format: str = "csv", device_id: Optional[str] = None, user_id: Optional[int] = None,
+                          start: Optional[str] = None, end: Optional[str] = None, page_size: int = EXPORT_PAGE_SIZE):
+    if format not in EXPORT_FORMATS:
+        return {"success": False, "error": f"Unsupported format: {format} (use csv, parquet or arrow)"}
+    if page_size < 1 or page_size > 50000:
+        return {"success": False, "error": "page_size must be between 1 and 50000"}
+    if not DATABASE_TOKEN:
+        return {"success": False, "error": "Database token not configured"}
+    if format != "csv":
+        try:
+            import pyarrow
+        except ImportError:
+            return {"success": False, "error": f"{format} export requires pyarrow (pip install pyarrow)"}
+    
+    pages = export_pages(device_id, user_id, start, end, page_size)
+    writers = {"csv": stream_csv, "parquet": stream_parquet, "arrow": stream_arrow}
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        writers[format](pages),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="health_metrics.{extension}"'}
+    )
+
+# Fleet statistics
+# Every instance keeps summaries of its latest FLEET_MEMORY_BUCKETS time buckets
+# and upserts them into fleet_sketches under its own row ids, so writers never
+# race. Each ingest request writes the buckets it touched in the same pipeline
+# as its activity updates, so nothing waits in memory for a later request and
+# no extra round trip is needed. Vitals use fixed-resolution histograms (exact
+# at sensor resolution and mergeable by adding counts) and active devices use
+# HyperLogLog. Queries merge the rows of every bucket in the window. Rows older
+# than FLEET_RETENTION_DAYS are deleted whenever an instance opens a bucket.
+FLEET_BUCKET_SECONDS = int(os.getenv("FLEET_BUCKET_SECONDS", "300"))
+FLEET_RETENTION_DAYS = int(os.getenv("FLEET_RETENTION_DAYS", "31"))
+FLEET_MEMORY_BUCKETS = 24
+FLEET_METRICS = {"heart_rate": 1, "spo2": 1, "temperature": 10}  # histogram bins per unit
+HLL_PRECISION = 11
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+fleet_instance_id = os.urandom(6).hex()
+fleet_lock = threading.Lock()
+fleet_buckets = {}
+fleet_row_counter = 0
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def parse_reading_time(timestamp):
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def fleet_bucket_start(moment):
+    seconds = int((moment - datetime(1970, 1, 1)).total_seconds())
+    return datetime(1970, 1, 1) + timedelta(seconds=seconds - seconds % FLEET_BUCKET_SECONDS)
+
+def new_fleet_sketch():
+    return {"readings": 0, "histograms": {metric: {} for metric in FLEET_METRICS}, "hll": bytearray(HLL_REGISTERS)}
+
+def hll_add(registers, item):
+    value = int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+    index = value >> (64 - HLL_PRECISION)
+    remaining = value & ((1 << (64 - HLL_PRECISION)) - 1)
+    rank = (64 - HLL_PRECISION) - remaining.bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+
+def hll_count(registers):
+    alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+    estimate = alpha * HLL_REGISTERS * HLL_REGISTERS / sum(2.0 ** -r for r in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * HLL_REGISTERS and zeros:
+        # Linear counting is more accurate for small fleets
+        estimate = HLL_REGISTERS * math.log(HLL_REGISTERS / zeros)
+    return int(round(estimate))
+
+def merge_fleet_sketch(target, source):
+    target["readings"] += source["readings"]
+    for metric, histogram in source["histograms"].items():
+        merged = target["histograms"].setdefault(metric, {})
+        for key, count in histogram.items():
+            merged[key] = merged.get(key, 0) + count
+    target["hll"] = bytearray(max(a, b) for a, b in zip(target["hll"], source["hll"]))
+
+def encode_fleet_sketch(sketch):
+    return json.dumps({
+        "readings": sketch["readings"],
+        "histograms": sketch["histograms"],
+        "hll": base64.b64encode(bytes(sketch["hll"])).decode()
+    }, separators=(",", ":"))
+
+def decode_fleet_sketch(text):
+    raw = json.loads(text)
+    return {
+        "readings": raw["readings"],
+        "histograms": {metric: {int(key): count for key, count in histogram.items()} for metric, histogram in raw["histograms"].items()},
+        "hll": bytearray(base64.b64decode(raw["hll"]))
+    }
+
+def record_fleet_readings(readings):
+    # Folds the readings into the in-memory sketches and returns snapshots of
+    # every bucket they touched, plus buckets pushed out of memory, for the
+    # caller to write with fleet_statements. Best effort: fleet statistics must
+    # never fail an ingest.
+    try:
+        with fleet_lock:
+            for data in readings:
+                moment = parse_reading_time(data.timestamp) or utc_now()
+                bucket = fleet_bucket_start(moment).isoformat()
+                entry = fleet_buckets.get(bucket)
+                if entry is None:
+                    entry = fleet_buckets[bucket] = new_fleet_entry()
+                
+                sketch = entry["sketch"]
+                sketch["readings"] += 1
+                for metric, scale in FLEET_METRICS.items():
+                    value = getattr(data, metric, None)
+                    if value is not None:
+                        key = int(round(value * scale))
+                        sketch["histograms"][metric][key] = sketch["histograms"][metric].get(key, 0) + 1
+                hll_add(sketch["hll"], data.device_id)
+                entry["dirty"] = True
+            
+            pending = []
+            while len(fleet_buckets) > FLEET_MEMORY_BUCKETS:
+                oldest = min(fleet_buckets)
+                if fleet_buckets[oldest]["dirty"]:
+                    pending.append(take_fleet_snapshot(oldest))
+                del fleet_buckets[oldest]
+            pending.extend(take_fleet_snapshot(bucket) for bucket, entry in fleet_buckets.items() if entry["dirty"])
+            return pending
+    except Exception as e:
+        logger.warning(f"Fleet sketch update failed: {e}")
+        return []
+
+def new_fleet_entry():
+    # Every entry is stored under its own row id. A bucket that comes back into
+    # memory after being evicted (a late upload) gets a new row, which queries
+    # add to the earlier one instead of replacing it.
+    global fleet_row_counter
+    fleet_row_counter += 1
+    return {"sketch": new_fleet_sketch(), "dirty": False, "written": False, "row_id": f"{fleet_instance_id}.{fleet_row_counter}"}
+
+def take_fleet_snapshot(bucket):
+    # Caller holds fleet_lock; the write itself happens after the lock is released
+    entry = fleet_buckets[bucket]
+    first_write = not entry["written"]
+    entry["dirty"] = False
+    entry["written"] = True
+    return bucket, entry["row_id"], entry["sketch"]["readings"], encode_fleet_sketch(entry["sketch"]), first_write
+
+def fleet_statements(snapshots):
+    # Sketches only grow, so a snapshot with fewer readings is stale and must not
+    # replace a newer one written concurrently by another thread. Opening a new
+    # row also prunes rows past the retention window, which keeps the table
+    # bounded however many instances and late uploads added rows.
+    statements = [(
+        "INSERT INTO fleet_sketches (bucket_start, instance_id, readings, sketch) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(bucket_start, instance_id) DO UPDATE SET readings = excluded.readings, sketch = excluded.sketch, updated_at = CURRENT_TIMESTAMP "
+        "WHERE excluded.readings >= fleet_sketches.readings",
+        [bucket, row_id, readings, sketch_text]
+    ) for bucket, row_id, readings, sketch_text, _ in snapshots]
+    if any(first_write for *_, first_write in snapshots):
+        cutoff = fleet_bucket_start(utc_now() - timedelta(days=FLEET_RETENTION_DAYS))
+        statements.append(("DELETE FROM fleet_sketches WHERE bucket_start < ?", [cutoff.isoformat()]))
+    return statements
+
+def settle_fleet_snapshots(snapshots, items):
+    # items: pipeline results of fleet_statements(snapshots), in order. Buckets
+    # whose write failed are marked dirty again so the next ingest or query
+    # retries them.
+    failed = [snapshot for snapshot, item in zip(snapshots, items) if item.get("type") != "ok"]
+    failed += snapshots[len(items):]
+    if failed:
+        with fleet_lock:
+            for bucket, row_id, *_ in failed:
+                entry = fleet_buckets.get(bucket)
+                if entry is not None and entry["row_id"] == row_id:
+                    entry["dirty"] = True
+        logger.warning(f"Fleet sketch write failed for {len(failed)} of {len(snapshots)} buckets")
+
+def flush_fleet_sketches():
+    with fleet_lock:
+        pending = [take_fleet_snapshot(bucket) for bucket, entry in fleet_buckets.items() if entry["dirty"]]
+    if pending:
+        try:
+            items = execute_turso_pipeline(fleet_statements(pending)).get("results", [])
+        except Exception:
+            items = []
+        settle_fleet_snapshots(pending, items)
+
+def histogram_quantile(items, total, q):
+    # items: sorted (bin, count) pairs; nearest-rank quantile
+    target = max(1, math.ceil(q * total))
+    seen = 0
+    for key, count in items:
+        seen += count
+        if seen >= target:
+            return key
+    return items[-1][0]
+
+FLEET_DEFAULT_QUANTILES = "0.5,0.95,0.99"
+FLEET_DEFAULT_SPO2_BELOW = 95
+
+@app.get("/fleet/stats", response_class=FastJSONResponse)
+def get_fleet_stats(minutes: int = 60, quantiles: str = FLEET_DEFAULT_QUANTILES, spo2_below: int = FLEET_DEFAULT_SPO2_BELOW):
+    if quantiles == FLEET_DEFAULT_QUANTILES and spo2_below == FLEET_DEFAULT_SPO2_BELOW:
+        return report_response(f"fleet-stats:{minutes}", build_fleet_stats, minutes)
+    return build_fleet_stats(minutes, quantiles, spo2_below)
+
+def build_fleet_stats(minutes, quantiles=FLEET_DEFAULT_QUANTILES, spo2_below=FLEET_DEFAULT_SPO2_BELOW):
+    try:
+        if minutes < 1 or minutes > 60 * 24 * 31:
+            return {"success": False, "error": "minutes must be between 1 and 44640"}
+        try:
+            levels = [float(q) for q in quantiles.split(",") if q.strip()]
+        except ValueError:
+            return {"success": False, "error": "quantiles must be a comma separated list such as 0.5,0.95"}
+        if any(q <= 0 or q > 1 for q in levels):
+            return {"success": False, "error": "quantiles must be in (0, 1]"}
+        
+        flush_fleet_sketches()
+        
+        now = utc_now()
+        window_start = fleet_bucket_start(now - timedelta(minutes=minutes))
+        rows = turso_rows(execute_turso_sql(
+            "SELECT bucket_start, sketch FROM fleet_sketches WHERE bucket_start >= ? AND bucket_start <= ?",
+            [window_start.isoformat(), now.isoformat()]
+        ))
+        
+        merged = new_fleet_sketch()
+        buckets = set()
+        for bucket_start, sketch_text in rows:
+            merge_fleet_sketch(merged, decode_fleet_sketch(sketch_text))
+            buckets.add(bucket_start)
+        
+        metrics = {}
+        for metric, scale in FLEET_METRICS.items():
+            items = sorted(merged["histograms"].get(metric, {}).items())
+            total = sum(count for _, count in items)
+            if not total:
+                metrics[metric] = {"count": 0}
+                continue
+            metrics[metric] = {
+                "count": total,
+                "mean": round(sum(key * count for key, count in items) / total / scale, 2),
+                "min": items[0][0] / scale,
+                "max": items[-1][0] / scale,
+                "quantiles": {f"p{round(q * 100, 1):g}": histogram_quantile(items, total, q) / scale for q in levels},
+                "resolution": 1 / scale
+            }
+        
+        spo2_items = merged["histograms"].get("spo2", {})
+        spo2_total = sum(spo2_items.values())
+        below = sum(count for key, count in spo2_items.items() if key < spo2_below)
+        
+        return {
+            "success": True,
+            "window": {
+                "minutes": minutes,
+                "from": window_start.isoformat(),
+                "to": now.isoformat(),
+                "bucket_seconds": FLEET_BUCKET_SECONDS,
+                "buckets": len(buckets)
+            },
+            "readings": merged["readings"],
+            "active_devices": hll_count(merged["hll"]),
+            "active_devices_error": round(1.04 / math.sqrt(HLL_REGISTERS), 4),
+            "metrics": metrics,
+            "spo2_below": {
+                "threshold": spo2_below,
+                "count": below,
+                "share": round(below / spo2_total, 4) if spo2_total else 0
+            }
+        }
+        
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+# Daily activity totals
+# steps and calories on a reading are cumulative counters. A day's total is the
+# sum of increases between consecutive readings, where a drop means the counter
+# was reset and the new value counts in full. The previous day's last value is
+# the baseline for the first reading of a day. One atomic upsert per reading
+# keeps the row current, whichever instance handles it:
+# - a reading after the latest one adds its delta and becomes the latest
+# - a reading before the earliest one is spliced in as the new first reading
+# - a reading in between (an offline buffer uploaded after live readings) can
+#   change the total when the counter reset around it, so the upsert returns
+#   the day's span and the caller recounts that band's day from health_metrics
+
+def counter_delta(previous, current):
+    return f"(CASE WHEN {previous} IS NULL THEN COALESCE({current}, 0) WHEN {current} IS NULL THEN 0 WHEN {current} >= {previous} THEN {current} - {previous} ELSE {current} END)"
+
+def daily_activity_total_update(column):
+    new_last = f"COALESCE(excluded.last_{column}, daily_activity.last_{column})"
+    new_first = f"COALESCE(excluded.first_{column}, daily_activity.first_{column})"
+    return (
+        f"{column} = CASE "
+        f"WHEN excluded.last_ts >= daily_activity.last_ts THEN daily_activity.{column} + {counter_delta(f'COALESCE(daily_activity.last_{column}, daily_activity.base_{column})', new_last)} "
+        f"WHEN excluded.first_ts < daily_activity.first_ts THEN daily_activity.{column} "
+        f"+ {counter_delta(f'daily_activity.base_{column}', new_first)} "
+        f"+ {counter_delta(new_first, f'daily_activity.first_{column}')} "
+        f"- {counter_delta(f'daily_activity.base_{column}', f'daily_activity.first_{column}')} "
+        f"ELSE daily_activity.{column} END"
+    )
+
+DAILY_ACTIVITY_UPSERT = (
+    "INSERT INTO daily_activity (device_id, day, steps, calories, base_steps, base_calories, first_ts, first_steps, first_calories, last_ts, last_steps, last_calories, readings) "
+    f"SELECT ?1, ?2, {counter_delta('previous.steps', '?4')}, {counter_delta('previous.calories', '?5')}, previous.steps, previous.calories, ?3, ?4, ?5, ?3, ?4, ?5, 1 "
+    "FROM (SELECT "
+    "(SELECT last_steps FROM daily_activity WHERE device_id = ?1 AND day < ?2 ORDER BY day DESC LIMIT 1) AS steps, "
+    "(SELECT last_calories FROM daily_activity WHERE device_id = ?1 AND day < ?2 ORDER BY day DESC LIMIT 1) AS calories"
+    ") AS previous WHERE 1 "
+    "ON CONFLICT(device_id, day) DO UPDATE SET "
+    f"{daily_activity_total_update('steps')}, "
+    f"{daily_activity_total_update('calories')}, "
+    "first_ts = MIN(daily_activity.first_ts, excluded.first_ts), "
+    "first_steps = CASE WHEN excluded.first_ts < daily_activity.first_ts THEN COALESCE(excluded.first_steps, daily_activity.first_steps) ELSE daily_activity.first_steps END, "
+    "first_calories = CASE WHEN excluded.first_ts < daily_activity.first_ts THEN COALESCE(excluded.first_calories, daily_activity.first_calories) ELSE daily_activity.first_calories END, "
+    "last_ts = MAX(daily_activity.last_ts, excluded.last_ts), "
+    "last_steps = CASE WHEN excluded.last_ts >= daily_activity.last_ts THEN COALESCE(excluded.last_steps, daily_activity.last_steps) ELSE daily_activity.last_steps END, "
+    "last_calories = CASE WHEN excluded.last_ts >= daily_activity.last_ts THEN COALESCE(excluded.last_calories, daily_activity.last_calories) ELSE daily_activity.last_calories END, "
+    "readings = daily_activity.readings + 1, "
+    "updated_at = CURRENT_TIMESTAMP "
+    "RETURNING first_ts, last_ts"
+)
+
+def daily_activity_recount(column):
+    # The band's readings of the day in time order, each against the one before
+    # it and the first against the previous day's baseline. The day filter
+    # matches activity_day_and_time (UTC date of the instant) and the text range
+    # around it keeps the scan to the band's rows near that day.
+    previous = f"COALESCE(previous, daily_activity.base_{column})"
+    return (
+        f"{column} = (SELECT COALESCE(SUM({counter_delta(previous, 'current')}), 0) FROM ("
+        f"SELECT {column} AS current, LAG({column}) OVER (ORDER BY julianday(timestamp), id) AS previous "
+        "FROM health_metrics WHERE device_id = ?1 AND timestamp >= date(?2, '-1 day') AND timestamp < date(?2, '+2 day') "
+        f"AND date(timestamp) = ?2 AND {column} IS NOT NULL))"
+    )
+
+DAILY_ACTIVITY_RECOUNT = (
+    "UPDATE daily_activity SET "
+    f"{daily_activity_recount('steps')}, "
+    f"{daily_activity_recount('calories')}, "
+    "updated_at = CURRENT_TIMESTAMP "
+    "WHERE device_id = ?1 AND day = ?2"
+)
+
+def activity_day_and_time(timestamp):
+    # Days are UTC dates of the reading's instant (naive timestamps are taken as
+    # UTC), the same definition as the dashboard's default "today". Keying by the
+    # wearer's local date would need the wearer's offset at query time too.
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        parsed = utc_now()
+    instant = parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+    return instant.date().isoformat(), instant.isoformat(timespec="microseconds")
+
+def activity_statements(data, day, instant):
+    # Daily totals (for readings with counters) and the band's activity session
+    statements = activity_session_statements(data, instant)
+    if data.steps is not None or data.calories is not None:
+        statements.insert(0, (DAILY_ACTIVITY_UPSERT, [data.device_id, day, instant, data.steps, data.calories]))
+    return statements
+
+def record_activity(readings):
+    # Best effort: the readings themselves are already stored. One round trip
+    # carries the fleet sketches the readings touched and the activity updates,
+    # each band's readings in time order.
+    fleet = record_fleet_readings(readings)
+    updates = []
+    for data in readings:
+        day, instant = activity_day_and_time(data.timestamp)
+        updates.append((data.device_id, instant, day, data))
+    updates.sort(key=lambda update: (update[0], update[1]))
+    items = []
+    try:
+        statements = fleet_statements(fleet)
+        daily = []  # (statement index, device_id, day, instant) of each daily upsert
+        for device_id, instant, day, data in updates:
+            for statement in activity_statements(data, day, instant):
+                if statement[0] is DAILY_ACTIVITY_UPSERT:
+                    daily.append((len(statements), device_id, day, instant))
+                statements.append(statement)
+        items = execute_turso_pipeline(statements).get("results", [])
+        failed = [item for item in items if item.get("type") != "ok"]
+        if failed:
+            logger.warning(f"Activity update failed for {len(failed)} of {len(statements)} statements: {failed[0].get('error', {}).get('message')}")
+        
+        # Readings that landed inside an existing day span: recount those days
+        recount = {}
+        for index, device_id, day, instant in daily:
+            rows = turso_rows({"results": items[index:index + 1]})
+            if rows and rows[0][0] < instant < rows[0][1]:
+                recount[(device_id, day)] = [device_id, day]
+        if recount:
+            result = execute_turso_pipeline([(DAILY_ACTIVITY_RECOUNT, params) for params in recount.values()])
+            failed = [item for item in result.get("results", []) if item.get("type") != "ok"]
+            if failed:
+                logger.warning(f"Daily activity recount failed for {len(failed)} of {len(recount)} days: {failed[0].get('error', {}).get('message')}")
+    except Exception as e:
+        logger.warning(f"Activity update failed: {e}")
+    settle_fleet_snapshots(fleet, items)
+
+def get_activity_today(device_id, day=None):
+    rows = turso_rows(execute_turso_sql(
+        "SELECT day, steps, calories, readings, last_ts FROM daily_activity WHERE device_id = ? AND day = ?",
+        [device_id, day or utc_now().date().isoformat()]
+    ))
+    if not rows:
+        return {"day": day or utc_now().date().isoformat(), "steps": 0, "calories": 0, "readings": 0, "last_reading": None}
+    day, steps, calories, readings, last_ts = rows[0]
+    return {"day": day, "steps": steps, "calories": calories, "readings": readings, "last_reading": last_ts}
+
+# Activity sessions
+# Consecutive readings of a band with the same activity, no more than
+# SESSION_GAP_SECONDS apart, form one session (active, rest or sleep). Ingest
+# only touches the band's latest session: the first statement extends it when
+# the reading continues it, the second starts a new one when it doesn't, so the
+# state per band is one row and either instance can apply the next reading.
+# Steps and calories are counter increases since the previous reading, taken
+# from the previous session when it ended within the gap. Readings older than
+# the latest session's end are left out of sessions.
+SESSION_GAP_SECONDS = int(os.getenv("SESSION_GAP_SECONDS", "600"))
+SESSION_KINDS = {"Resting": "rest", "Sleeping": "sleep"}  # everything else is "active"
+MAX_SESSIONS_PER_QUERY = 5000
+
+def session_counter_delta(previous, current):
+    # Like counter_delta, but with no previous value there is no increase to count
+    return f"(CASE WHEN {previous} IS NULL THEN 0 ELSE {counter_delta(previous, current)} END)"
+
+def latest_session(column):
+    return f"(SELECT {column} FROM activity_sessions WHERE device_id = ?1 ORDER BY end_ts DESC, id DESC LIMIT 1)"
+
+# ?1 device, ?2 UTC instant, ?3 activity, ?4 kind, ?5 steps, ?6 calories, ?7 heart rate, ?8 instant - gap
+SESSION_EXTEND = (
+    "UPDATE activity_sessions SET "
+    "end_ts = ?2, "
+    "readings = readings + 1, "
+    f"steps = steps + {session_counter_delta('last_steps', '?5')}, "
+    f"calories = calories + {session_counter_delta('last_calories', '?6')}, "
+    "last_steps = COALESCE(?5, last_steps), "
+    "last_calories = COALESCE(?6, last_calories), "
+    "hr_count = hr_count + (?7 IS NOT NULL), "
+    "hr_sum = hr_sum + COALESCE(?7, 0), "
+    "hr_min = MIN(COALESCE(hr_min, ?7), COALESCE(?7, hr_min)), "
+    "hr_max = MAX(COALESCE(hr_max, ?7), COALESCE(?7, hr_max)), "
+    "updated_at = CURRENT_TIMESTAMP "
+    f"WHERE id = {latest_session('id')} AND activity = ?3 AND end_ts <= ?2 AND end_ts >= ?8"
+)
+
+SESSION_START = (
+    "INSERT INTO activity_sessions (device_id, activity, kind, start_ts, end_ts, readings, steps, calories, last_steps, last_calories, hr_count, hr_sum, hr_min, hr_max) "
+    f"SELECT ?1, ?3, ?4, ?2, ?2, 1, {session_counter_delta('previous.base_steps', '?5')}, {session_counter_delta('previous.base_calories', '?6')}, "
+    "COALESCE(?5, previous.base_steps), COALESCE(?6, previous.base_calories), (?7 IS NOT NULL), COALESCE(?7, 0), ?7, ?7 "
+    "FROM (SELECT end_ts, activity, "
+    "CASE WHEN end_ts >= ?8 THEN last_steps END AS base_steps, "
+    "CASE WHEN end_ts >= ?8 THEN last_calories END AS base_calories "
+    f"FROM (SELECT {latest_session('end_ts')} AS end_ts, {latest_session('activity')} AS activity, "
+    f"{latest_session('last_steps')} AS last_steps, {latest_session('last_calories')} AS last_calories)) AS previous "
+    # After SESSION_EXTEND has run, a continued session matches the last condition
+    "WHERE previous.end_ts IS NULL OR (previous.end_ts <= ?2 AND NOT (previous.activity = ?3 AND previous.end_ts >= ?8))"
+)
+
+def activity_session_statements(data, instant):
+    activity = data.activity or "Walking"
+    cutoff = (datetime.fromisoformat(instant) - timedelta(seconds=SESSION_GAP_SECONDS)).isoformat(timespec="microseconds")
+    params = [data.device_id, instant, activity, SESSION_KINDS.get(activity, "active"), data.steps, data.calories, data.heart_rate, cutoff]
+    return [(SESSION_EXTEND, params), (SESSION_START, params)]
+
+@app.get("/activity-sessions/{device_id}", response_class=FastJSONResponse)
+def get_activity_sessions(device_id: str, start: Optional[str] = None, end: Optional[str] = None, kind: Optional[str] = None, limit: int = 500):
+    try:
+        range_end = parse_reading_time(end) if end else utc_now()
+        range_start = parse_reading_time(start) if start else range_end - timedelta(hours=24)
+        if range_start is None or range_end is None:
+            return {"success": False, "error": "start and end must be ISO 8601 timestamps"}
+        if kind is not None and kind not in ("active", "rest", "sleep"):
+            return {"success": False, "error": "kind must be active, rest or sleep"}
+        if limit < 1 or limit > MAX_SESSIONS_PER_QUERY:
+            return {"success": False, "error": f"limit must be between 1 and {MAX_SESSIONS_PER_QUERY}"}
+        
+        # Sessions overlapping the range
+        sql = "SELECT activity, kind, start_ts, end_ts, readings, steps, calories, hr_count, hr_sum, hr_min, hr_max FROM activity_sessions WHERE device_id = ? AND end_ts >= ? AND start_ts <= ?"
+        params = [device_id, range_start.isoformat(timespec="microseconds"), range_end.isoformat(timespec="microseconds")]
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        rows = turso_rows(execute_turso_sql(sql + " ORDER BY start_ts LIMIT ?", params + [limit]))
+        
+        session_list = []
+        totals = {}
+        for activity, session_kind, start_ts, end_ts, readings, steps, calories, hr_count, hr_sum, hr_min, hr_max in rows:
+            duration = int((datetime.fromisoformat(end_ts) - datetime.fromisoformat(start_ts)).total_seconds())
+            session_list.append({
+                "activity": activity,
+                "kind": session_kind,
+                "start": start_ts,
+                "end": end_ts,
+                "duration_seconds": duration,
+                "readings": readings,
+                "steps": steps,
+                "calories": calories,
+                "heart_rate": {"avg": round(hr_sum / hr_count, 1), "min": hr_min, "max": hr_max} if hr_count else None
+            })
+            total = totals.setdefault(session_kind, {"sessions": 0, "duration_seconds": 0, "steps": 0, "calories": 0})
+            total["sessions"] += 1
+            total["duration_seconds"] += duration
+            total["steps"] += steps
+            total["calories"] += calories
+        
+        return FastJSONResponse({
+            "success": True,
+            "device_id": device_id,
+            "from": range_start.isoformat(),
+            "to": range_end.isoformat(),
+            "sessions": session_list,
+            "count": len(session_list),
+            "totals": totals
+        })
+        
+    except Exception as e:
+        return {"success": False, "error": str(e), "device_id": device_id, "sessions": [], "count": 0}
+
+# Report snapshots
+# The hottest report variants (REPORT_SNAPSHOTS, "name:argument") are built
+# ahead of time every REPORT_REFRESH_SECONDS, give or take REPORT_REFRESH_JITTER,
+# and stored in report_snapshots so every instance can serve them. Only the
+# instance holding the scheduler lease builds them; the others just read the
+# rows. Each instance starts its scheduler thread the first time a hot variant
+# is requested. Snapshots older than REPORT_SNAPSHOT_MAX_AGE_SECONDS are not
+# served. On serverless hosts the lease holder's thread is frozen between its
+# requests, so a stale snapshot also frees the lease for any other instance,
+# and a request that had to build a hot variant live stores the result as the
+# new snapshot. Other parameters are always computed live.
+REPORT_SNAPSHOTS_ENABLED = env_flag("REPORT_SNAPSHOTS_ENABLED", "true")
+REPORT_SNAPSHOTS = [key.strip() for key in os.getenv("REPORT_SNAPSHOTS", "recent:24,latest-entries:10,fleet-stats:60").split(",") if key.strip()]
+REPORT_REFRESH_SECONDS = float(os.getenv("REPORT_REFRESH_SECONDS", "60"))
+REPORT_REFRESH_JITTER = float(os.getenv("REPORT_REFRESH_JITTER", "0.2"))
+REPORT_SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("REPORT_SNAPSHOT_MAX_AGE_SECONDS", str(3 * REPORT_REFRESH_SECONDS)))
+REPORT_SNAPSHOT_RECHECK_SECONDS = 5
+REPORT_LEASE = "report-snapshots"
+REPORT_BUILDERS = {
+    "recent": build_recent_report,
+    "latest-entries": build_latest_entries,
+    "fleet-stats": build_fleet_stats,
+}
+
+report_snapshots = {}
+report_snapshots_lock = threading.Lock()
+report_scheduler = None
+
+def report_response(key, build, *args):
+    if not REPORT_SNAPSHOTS_ENABLED or key not in REPORT_SNAPSHOTS:
+        payload = build(*args)
+    else:
+        start_report_scheduler()
+        entry = None
+        try:
+            entry = cached_report_snapshot(key)
+        except Exception as e:
+            logger.warning(f"Report snapshot read failed for {key}: {e}")
+        if METRICS_ENABLED:
+            inc_metric("report_snapshot_lookups_total", (("report", key), ("result", "hit" if entry else "miss")))
+        if entry is not None:
+            age = max(0.0, time.time() - entry["generated_at"])
+            return FastJSONResponse(
+                {**entry["payload"], "snapshot": {
+                    "generated_at": datetime.fromtimestamp(entry["generated_at"], timezone.utc).isoformat(),
+                    "age_seconds": round(age, 1)
+                }},
+                headers={"Age": str(int(age))}
+            )
+        generated_at = time.time()
+        payload = build(*args)
+        if payload.get("success"):
+            try:
+                store_report_snapshot(key, payload, generated_at)
+            except Exception as e:
+                logger.warning(f"Report snapshot {key} failed: {e}")
+    return FastJSONResponse(payload) if payload.get("success") else payload
+
+def cached_report_snapshot(key):
+    # Returns the snapshot entry to serve, or None. The stored row is re-read once
+    # the local copy is a refresh interval old, at most every few seconds.
+    now = time.time()
+    with report_snapshots_lock:
+        entry = report_snapshots.get(key)
+    if entry is None or (now - entry["generated_at"] >= REPORT_REFRESH_SECONDS and now - entry["fetched_at"] >= REPORT_SNAPSHOT_RECHECK_SECONDS):
+        rows = turso_rows(execute_turso_sql("SELECT body, generated_at FROM report_snapshots WHERE report_key = ?", [key]))
+        if rows:
+            entry = {"payload": json.loads(rows[0][0]), "generated_at": float(rows[0][1]), "fetched_at": now}
+        else:
+            entry = {"payload": None, "generated_at": 0.0, "fetched_at": now}
+        with report_snapshots_lock:
+            report_snapshots[key] = entry
+    if entry["payload"] is None or now - entry["generated_at"] > REPORT_SNAPSHOT_MAX_AGE_SECONDS:
+        return None
+    return entry
+
+def acquire_lease(name, seconds, stale=None):
+    # True when this instance holds the lease for the next `seconds`. The holder
+    # renews it on every run, so it stays put until that instance goes away.
+    # `stale` is an optional (sql condition, params) under which any instance
+    # may take the lease early: the holder is around but not doing the job.
+    now = time.time()
+    takeover, takeover_params = stale or ("0", [])
+    result = execute_turso_sql(
+        "INSERT INTO scheduler_leases (name, holder, expires_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+        f"WHERE scheduler_leases.expires_at < ? OR scheduler_leases.holder = excluded.holder OR ({takeover})",
+        [name, fleet_instance_id, now + seconds, now, *takeover_params]
+    )
+    items = result.get("results", [])
+    return bool(items) and items[0].get("type") == "ok" and bool(items[0]["response"]["result"].get("affected_row_count"))
+
+def refresh_report_snapshots():
+    for key in REPORT_SNAPSHOTS:
+        name, _, argument = key.partition(":")
+        build = REPORT_BUILDERS.get(name)
+        if build is None:
+            logger.warning(f"Unknown report snapshot {key}")
+            continue
+        try:
+            generated_at = time.time()
+            payload = build(*([int(argument)] if argument else []))
+            if not payload.get("success"):
+                logger.warning(f"Report snapshot {key} failed: {payload.get('error')}")
+                continue
+            store_report_snapshot(key, payload, generated_at)
+        except Exception as e:
+            logger.warning(f"Report snapshot {key} failed: {e}")
+
+def store_report_snapshot(key, payload, generated_at):
+    # A snapshot never replaces one built later, by the scheduler or a live request
+    body = orjson.dumps(payload).decode() if orjson is not None else json.dumps(payload)
+    execute_turso_sql(
+        "INSERT INTO report_snapshots (report_key, body, generated_at, generated_by) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(report_key) DO UPDATE SET body = excluded.body, generated_at = excluded.generated_at, generated_by = excluded.generated_by "
+        "WHERE excluded.generated_at > report_snapshots.generated_at",
+        [key, body, generated_at, fleet_instance_id]
+    )
+    with report_snapshots_lock:
+        entry = report_snapshots.get(key)
+        if entry is None or entry["generated_at"] < generated_at:
+            report_snapshots[key] = {"payload": payload, "generated_at": generated_at, "fetched_at": time.time()}
+
+def report_snapshots_stale():
+    # Lease takeover condition: a snapshot the scheduler builds is missing or past its max age
+    keys = [key for key in REPORT_SNAPSHOTS if key.partition(":")[0] in REPORT_BUILDERS]
+    if not keys:
+        return None
+    return (
+        f"(SELECT COUNT(*) FROM report_snapshots WHERE report_key IN ({', '.join(['?'] * len(keys))}) AND generated_at >= ?) < ?",
+        [*keys, time.time() - REPORT_SNAPSHOT_MAX_AGE_SECONDS, len(keys)]
+    )
+
+def run_report_scheduler():
+    # A random first delay spreads instances that start together
+    time.sleep(random.uniform(0, REPORT_REFRESH_SECONDS * REPORT_REFRESH_JITTER))
+    while True:
+        try:
+            if acquire_lease(REPORT_LEASE, 2 * REPORT_REFRESH_SECONDS, report_snapshots_stale()):
+                refresh_report_snapshots()
+        except Exception as e:
+            logger.warning(f"Report scheduler run failed: {e}")
+        time.sleep(REPORT_REFRESH_SECONDS * random.uniform(1 - REPORT_REFRESH_JITTER, 1 + REPORT_REFRESH_JITTER))
+
+def start_report_scheduler():
+    global report_scheduler
+    if report_scheduler is None:
+        with report_snapshots_lock:
+            if report_scheduler is None:
+                report_scheduler = threading.Thread(target=run_report_scheduler, name="report-scheduler", daemon=True)
+                report_scheduler.start()